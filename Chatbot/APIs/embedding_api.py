@@ -1,29 +1,77 @@
-from fastapi import FastAPI
-from sentence_transformers import SentenceTransformer
+from fastapi import FastAPI, Header, HTTPException, Response
 from pydantic import BaseModel
+from typing import List, Optional
 import numpy as np
+from config_helper import get_embedding_config
+from APIs.embedding_system.service import EmbeddingService, ServiceNotReady
+from APIs.embedding_system.wire import (
+    COUNT_HEADER, DIM_HEADER, JSON_MEDIA_TYPE, encode_embeddings, negotiate_media_type
+)
 app = FastAPI()
 
+service = EmbeddingService(get_embedding_config())
 
-model = SentenceTransformer("Camellia-Mohamed/fine-tuned-sbert-for-tourism")
-def split_into_chunks(text, chunk_size=200, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i+chunk_size])
-        chunks.append(chunk)
-    return chunks
+@app.on_event("startup")
+def start_service():
+    """Start loading the model in the background so liveness probes answer immediately."""
+    service.start(background=True)
+
+@app.on_event("shutdown")
+def stop_service():
+    service.stop()
+
+def embed_texts(texts: List[str]) -> List[np.ndarray]:
+    try:
+        return service.embed_texts(texts)
+    except ServiceNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
 class TextRequest(BaseModel):
     text: str
+
+class BatchTextRequest(BaseModel):
+    texts: List[str]
+
+def binary_response(embeddings: List[np.ndarray], media_type: str) -> Response:
+    matrix = np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    return Response(
+        content=encode_embeddings(matrix, media_type),
+        media_type=media_type,
+        headers={DIM_HEADER: str(matrix.shape[1]), COUNT_HEADER: str(matrix.shape[0])}
+    )
+
 @app.post("/api/embeddings/text")
-def get_embedding(request: TextRequest):
-    chunks = split_into_chunks(request.text)
-    chunk_embeddings = model.encode(chunks)
-    final_embedding = np.mean(chunk_embeddings, axis=0)
+def get_embedding(request: TextRequest, accept: Optional[str] = Header(None)):
+    final_embedding = embed_texts([request.text])[0]
+    media_type = negotiate_media_type(accept)
+    if media_type != JSON_MEDIA_TYPE:
+        return binary_response([final_embedding], media_type)
     return {"embedding": final_embedding.tolist()}
 
+@app.post("/api/embeddings/batch")
+def get_embeddings_batch(request: BatchTextRequest, accept: Optional[str] = Header(None)):
+    embeddings = embed_texts(request.texts)
+    media_type = negotiate_media_type(accept)
+    if media_type != JSON_MEDIA_TYPE:
+        return binary_response(embeddings, media_type)
+    return {"embeddings": [embedding.tolist() for embedding in embeddings]}
+
+@app.get("/api/embeddings/stats")
+def get_stats():
+    return service.stats()
+
+@app.get("/health/live")
+def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness(response: Response):
+    health = service.health()
+    if not health["ready"]:
+        response.status_code = 503
+    return health
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,86 @@
+from typing import Any, Dict, Optional
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+CHATBOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def backend_namespace(model_name: str, backend_config: Dict[str, Any]) -> str:
+    """Identify the vectors a backend produces, so caches never mix fp32 and int8 outputs."""
+    backend = backend_config.get('type', 'torch')
+    if backend == "onnx-int8":
+        return f"{model_name}:{backend}:{backend_config.get('quantization', 'avx2')}"
+    return f"{model_name}:{backend}"
+
+
+def _export_dir(model_name: str, backend_config: Dict[str, Any]) -> str:
+    base_dir = os.path.join(CHATBOT_DIR, backend_config.get('export_dir', '.embedding_models'))
+    return os.path.join(base_dir, model_name.replace('/', '__'))
+
+
+def _onnx_model_kwargs(num_threads: Optional[int]) -> Dict[str, Any]:
+    if not num_threads:
+        return {}
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = num_threads
+    session_options.inter_op_num_threads = 1
+    return {"session_options": session_options}
+
+
+def _load_int8(model_name: str, backend_config: Dict[str, Any], num_threads: Optional[int] = None):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    quantization = backend_config.get('quantization', 'avx2')
+    if quantization not in QUANTIZATION_CONFIGS:
+        raise ValueError(f"Unknown quantization config '{quantization}', expected one of {QUANTIZATION_CONFIGS}")
+
+    export_dir = _export_dir(model_name, backend_config)
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        logger.info(f"Exporting {model_name} to ONNX with dynamic int8 quantization ({quantization})")
+        onnx_model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        onnx_model.save_pretrained(export_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, export_dir)
+
+    model_kwargs = {"file_name": file_name, **_onnx_model_kwargs(num_threads)}
+    return SentenceTransformer(export_dir, backend="onnx", device="cpu", model_kwargs=model_kwargs)
+
+
+def load_model(model_name: str, backend_config: Dict[str, Any], num_threads: Optional[int] = None):
+    """
+    Load the sentence transformer on the configured inference backend.
+
+    - ``torch``: plain PyTorch fp32 (the original behaviour)
+    - ``onnx``: ONNX Runtime fp32 graph
+    - ``onnx-int8``: ONNX Runtime with dynamic int8 quantization, exported once and reused
+
+    ``num_threads`` caps the intra-op threads, which matters when several workers share a box.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend_config.get('type', 'torch')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+    start_time = time.time()
+    if backend == "torch":
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+        model = SentenceTransformer(model_name, device="cpu")
+    elif backend == "onnx":
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu",
+                                    model_kwargs=_onnx_model_kwargs(num_threads))
+    else:
+        model = _load_int8(model_name, backend_config, num_threads)
+    logger.info(f"Loaded {model_name} on the {backend} backend in {time.time() - start_time:.2f}s")
+    return model
@@ -0,0 +1,157 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from APIs.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingRequest:
+    chunks: List[str]
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent encode requests into a single forward pass.
+
+    The first request to arrive opens a batch window of ``max_wait_ms``; every request
+    that arrives before the window closes (or before ``max_batch_size`` chunks have
+    been collected) is encoded together and each caller gets back its own rows.
+
+    ``max_in_flight`` lets several batches run at once when ``encode_fn`` fans out to a
+    worker pool; while every slot is busy new requests keep accumulating in the queue.
+    ``encode()`` waits at most ``timeout_seconds``, and ``stop()`` fails whatever is
+    still queued.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: float = 5,
+                 max_in_flight: int = 1, timeout_seconds: float = 120):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.timeout_seconds = timeout_seconds
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._executor = None
+        self._thread = None
+        self._running = False
+        self.queue_depth = Histogram()
+        self.batch_sizes = Histogram()
+        self.requests_per_batch = Histogram()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.max_in_flight > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embedding-batch")
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Micro-batcher started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:g})")
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.future.set_exception(RuntimeError("Micro-batcher stopped"))
+
+    def submit(self, chunks: List[str]) -> Future:
+        """Queue chunks for encoding; the future resolves to an array with one row per chunk."""
+        pending = _PendingRequest(chunks=list(chunks))
+        if not self._running:
+            pending.future.set_exception(RuntimeError("Micro-batcher is not running"))
+            return pending.future
+        self.queue_depth.observe(self._queue.qsize())
+        self._queue.put(pending)
+        return pending.future
+
+    def encode(self, chunks: List[str]) -> np.ndarray:
+        """Blocking helper for callers running in a worker thread."""
+        try:
+            return self.submit(chunks).result(timeout=self.timeout_seconds)
+        except FutureTimeoutError:
+            raise RuntimeError(f"Embedding batch did not finish within {self.timeout_seconds}s")
+
+    def _collect_batch(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        size = len(first.chunks)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.chunks)
+        return batch
+
+    def _run(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._slots.acquire()
+            batch = self._collect_batch(first)
+            if self._executor:
+                self._executor.submit(self._process, batch)
+            else:
+                self._process(batch)
+
+    def _process(self, batch: List[_PendingRequest]):
+        try:
+            self._encode_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _encode_batch(self, batch: List[_PendingRequest]):
+        all_chunks = []
+        offsets = []
+        for pending in batch:
+            offsets.append((len(all_chunks), len(all_chunks) + len(pending.chunks)))
+            all_chunks.extend(pending.chunks)
+
+        self.batch_sizes.observe(len(all_chunks))
+        self.requests_per_batch.observe(len(batch))
+
+        try:
+            embeddings = np.asarray(self.encode_fn(all_chunks))
+        except Exception as e:
+            logger.error(f"Error encoding batch of {len(all_chunks)} chunks: {str(e)}")
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        for pending, (start, end) in zip(batch, offsets):
+            pending.future.set_result(embeddings[start:end])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth_now": self._queue.qsize(),
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "requests_per_batch": self.requests_per_batch.snapshot(),
+        }
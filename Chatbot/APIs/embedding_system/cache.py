@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key, timestamp, OrderedDict node) on top of the vector itself
+ENTRY_OVERHEAD_BYTES = 120
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str, lowercase: bool = False) -> str:
+    """Normalize text so trivially different inputs share one cache entry."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.lower() if lowercase else text
+
+
+def text_key(text: str) -> bytes:
+    """Content address of an already-normalized text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Byte-bounded LRU cache of embeddings with an optional TTL."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _remove(self, key: bytes):
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            vector, stored_at = entry
+            if self._expired(stored_at, now):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        return [self.get(key) for key in keys]
+
+    def put(self, key: bytes, vector: np.ndarray):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        size = vector.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (vector, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
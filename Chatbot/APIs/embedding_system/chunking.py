@@ -0,0 +1,65 @@
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def split_into_chunks(text, chunk_size=200, overlap=50):
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = " ".join(words[i:i+chunk_size])
+        chunks.append(chunk)
+    return chunks
+
+
+class TokenChunker:
+    """
+    Split text into windows that fit the model's token budget.
+
+    Windows always start from the beginning of the text with a deterministic stride and
+    are snapped to word boundaries, so appending a message to a conversation leaves every
+    earlier chunk byte-for-byte identical and only the tail chunk misses the cache.
+    """
+
+    def __init__(self, tokenizer, max_seq_length: int, overlap_tokens: int = 0, max_tokens: Optional[int] = None):
+        self.tokenizer = tokenizer
+        budget = max_seq_length - tokenizer.num_special_tokens_to_add(pair=False)
+        self.max_tokens = max(1, min(budget, max_tokens) if max_tokens else budget)
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.max_tokens - 1))
+        self.supports_offsets = getattr(tokenizer, "is_fast", False)
+        if not self.supports_offsets:
+            logger.warning("Tokenizer has no offset mapping, falling back to word-based chunks")
+
+    @staticmethod
+    def _word_start(word_ids: List[Optional[int]], index: int) -> int:
+        """Move an index back to the first token of the word it falls inside."""
+        while 0 < index < len(word_ids) and word_ids[index] is not None and word_ids[index] == word_ids[index - 1]:
+            index -= 1
+        return index
+
+    def split(self, text: str) -> List[str]:
+        if not self.supports_offsets:
+            return split_into_chunks(text)
+
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        offsets = encoding["offset_mapping"]
+        num_tokens = len(offsets)
+        if num_tokens <= self.max_tokens:
+            return [text] if text else []
+        word_ids = encoding.word_ids()
+
+        chunks = []
+        start = 0
+        while True:
+            end = min(start + self.max_tokens, num_tokens)
+            if end < num_tokens:
+                snapped = self._word_start(word_ids, end)
+                # A single word longer than the budget still has to be cut somewhere
+                end = snapped if snapped > start else end
+            chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+            if end >= num_tokens:
+                break
+            next_start = self._word_start(word_ids, end - self.overlap_tokens)
+            start = next_start if next_start > start else end
+        return chunks
@@ -0,0 +1,130 @@
+"""
+Compare a candidate embedding backend against the fp32 PyTorch model on the catalog.
+
+Usage (from the Chatbot directory):
+    python -m APIs.embedding_system.parity --backend onnx-int8 --quantization avx2
+
+Reports the cosine similarity between fp32 and candidate vectors for every catalog
+description, the top-k neighbour overlap for a set of typical user queries, and the
+encode speed-up. Exits non-zero when the drift is beyond the given thresholds.
+"""
+from typing import List
+import argparse
+import logging
+import sys
+import time
+import numpy as np
+import psycopg2
+from config_helper import get_db_params, get_embedding_config
+from APIs.embedding_system.backends import BACKENDS, QUANTIZATION_CONFIGS, load_model
+
+logger = logging.getLogger(__name__)
+
+CATALOG_QUERIES = {
+    "states": "SELECT description FROM states WHERE description IS NOT NULL",
+    "activities": "SELECT description FROM activities WHERE description IS NOT NULL",
+    "landmarks": "SELECT description FROM landmarks WHERE description IS NOT NULL",
+    "trips": "SELECT description FROM trips WHERE description IS NOT NULL",
+}
+
+SAMPLE_QUERIES = [
+    "diving and snorkeling in the red sea",
+    "visit the pyramids and ancient temples",
+    "a quiet beach holiday with my family",
+    "nile cruise and historical sites",
+    "desert safari and camping under the stars",
+    "museums and islamic architecture in old cairo",
+    "luxury resort with spa and golf",
+    "hiking mount sinai at sunrise",
+]
+
+
+def fetch_catalog_texts(limit: int) -> List[str]:
+    texts = []
+    conn = psycopg2.connect(**get_db_params())
+    try:
+        with conn.cursor() as cur:
+            for table, query in CATALOG_QUERIES.items():
+                cur.execute(query + " LIMIT %s", (limit,))
+                rows = [row[0] for row in cur.fetchall()]
+                logger.info(f"Loaded {len(rows)} descriptions from {table}")
+                texts.extend(rows)
+    finally:
+        conn.close()
+    return texts
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def timed_encode(model, texts: List[str]) -> tuple:
+    start_time = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=32), dtype=np.float32)
+    return vectors, time.perf_counter() - start_time
+
+
+def top_k_overlap(reference: np.ndarray, candidate: np.ndarray, reference_queries: np.ndarray,
+                  candidate_queries: np.ndarray, k: int) -> float:
+    k = min(k, reference.shape[0])
+    reference_top = np.argsort(-(reference_queries @ reference.T), axis=1)[:, :k]
+    candidate_top = np.argsort(-(candidate_queries @ candidate.T), axis=1)[:, :k]
+    overlaps = [len(set(ref) & set(cand)) / k for ref, cand in zip(reference_top, candidate_top)]
+    return float(np.mean(overlaps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check embedding drift of a backend against fp32 PyTorch")
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="Candidate backend (defaults to config.yml)")
+    parser.add_argument("--quantization", choices=QUANTIZATION_CONFIGS, default=None)
+    parser.add_argument("--limit", type=int, default=500, help="Max descriptions per catalog table")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-mean-cosine", type=float, default=0.99)
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    embedding_config = get_embedding_config()
+    model_name = embedding_config.get('model', "Camellia-Mohamed/fine-tuned-sbert-for-tourism")
+    candidate_config = dict(embedding_config.get('backend', {}))
+    if args.backend:
+        candidate_config['type'] = args.backend
+    if args.quantization:
+        candidate_config['quantization'] = args.quantization
+
+    texts = fetch_catalog_texts(args.limit)
+    if not texts:
+        logger.error("No catalog descriptions found")
+        sys.exit(1)
+
+    reference_model = load_model(model_name, {'type': 'torch'})
+    candidate_model = load_model(model_name, candidate_config)
+
+    reference, reference_time = timed_encode(reference_model, texts)
+    candidate, candidate_time = timed_encode(candidate_model, texts)
+    reference, candidate = normalize(reference), normalize(candidate)
+
+    cosines = np.sum(reference * candidate, axis=1)
+    overlap = top_k_overlap(
+        reference, candidate,
+        normalize(timed_encode(reference_model, SAMPLE_QUERIES)[0]),
+        normalize(timed_encode(candidate_model, SAMPLE_QUERIES)[0]),
+        args.top_k
+    )
+
+    print(f"Backend: {candidate_config.get('type', 'torch')} ({len(texts)} catalog descriptions)")
+    print(f"Cosine vs fp32: mean={cosines.mean():.5f} p5={np.percentile(cosines, 5):.5f} min={cosines.min():.5f}")
+    print(f"Top-{args.top_k} neighbour overlap on sample queries: {overlap:.3f}")
+    print(f"Encode time: fp32={reference_time:.2f}s candidate={candidate_time:.2f}s "
+          f"speed-up={reference_time / max(candidate_time, 1e-9):.2f}x")
+
+    if cosines.mean() < args.min_mean_cosine or overlap < args.min_overlap:
+        print("FAIL: retrieval quality is below the configured thresholds")
+        sys.exit(1)
+    print("PASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Optional PCA dimension reduction for stored and query embeddings.
+
+Usage (from the Chatbot directory):
+    python -m APIs.embedding_system.reduction fit --dim 128
+    python -m APIs.embedding_system.reduction migrate
+    python -m APIs.embedding_system.reduction report --top-k 10
+    python -m APIs.embedding_system.reduction rollback
+
+``fit`` learns the projection from the full-width catalog embeddings and saves it next
+to the exported model. ``migrate`` keeps the original vectors in ``embedding_full`` and
+rewrites ``embedding`` with the projected ones, so every existing ``embedding <=>``
+query keeps working once ``embedding.reduction.enabled`` is switched on for the
+service. ``report`` compares recall@k of reduced against full-width search.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tables holding an ``embedding`` column, with their primary keys
+EMBEDDING_TABLES = {
+    "states": "state_id",
+    "activities": "activity_id",
+    "landmarks": "landmark_id",
+    "trips": "trip_id",
+}
+
+FULL_COLUMN = "embedding_full"
+
+
+class PcaProjection:
+    """Mean-centred linear projection onto the top principal components."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance_ratio: np.ndarray,
+                 namespace: str = ""):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.explained_variance_ratio = np.asarray(explained_variance_ratio, dtype=np.float32)
+        self.namespace = namespace
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, dim: int, namespace: str = "") -> "PcaProjection":
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if dim >= matrix.shape[1]:
+            raise ValueError(f"Target dimension {dim} must be smaller than {matrix.shape[1]}")
+        mean = matrix.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(mean, vt[:dim], (variance / variance.sum())[:dim], namespace)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return (vectors - self.mean) @ self.components.T
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, mean=self.mean, components=self.components,
+                 explained_variance_ratio=self.explained_variance_ratio, namespace=np.array(self.namespace))
+
+    @classmethod
+    def load(cls, path: str) -> "PcaProjection":
+        data = np.load(path)
+        return cls(data["mean"], data["components"], data["explained_variance_ratio"], str(data["namespace"]))
+
+
+def projection_path(model_name: str, config: Dict[str, Any]) -> str:
+    """Where the projection for the configured model and dimension lives."""
+    from APIs.embedding_system.backends import CHATBOT_DIR, _export_dir
+
+    reduction_config = config.get('reduction', {})
+    if reduction_config.get('path'):
+        return os.path.join(CHATBOT_DIR, reduction_config['path'])
+    return os.path.join(_export_dir(model_name, config.get('backend', {})), f"pca_{reduction_config.get('dim', 128)}.npz")
+
+
+def load_projection(model_name: str, config: Dict[str, Any]) -> Optional[PcaProjection]:
+    """Load the projection when reduction is enabled; fails loudly if it has not been fitted."""
+    if not config.get('reduction', {}).get('enabled', False):
+        return None
+    path = projection_path(model_name, config)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Dimension reduction is enabled but {path} does not exist, "
+                                f"run `python -m APIs.embedding_system.reduction fit` first")
+    projection = PcaProjection.load(path)
+    from APIs.embedding_system.backends import backend_namespace
+
+    namespace = backend_namespace(model_name, config.get('backend', {}))
+    if projection.namespace and projection.namespace != namespace:
+        logger.warning(f"PCA projection was fitted on {projection.namespace} but the service runs {namespace}")
+    logger.info(f"Loaded PCA projection {projection.input_dim} -> {projection.output_dim} dims from {path}")
+    return projection
+
+
+def _has_column(cur, table: str, column: str) -> bool:
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return cur.fetchone() is not None
+
+
+def _fetch_vectors(cur, table: str, column: str) -> Tuple[List[Any], np.ndarray]:
+    key = EMBEDDING_TABLES[table]
+    cur.execute(f"SELECT {key}, {column}::real[] FROM {table} WHERE {column} IS NOT NULL ORDER BY {key}")
+    rows = cur.fetchall()
+    if not rows:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return [row[0] for row in rows], np.asarray([row[1] for row in rows], dtype=np.float32)
+
+
+def _source_column(cur, table: str) -> str:
+    """Full-width vectors live in embedding_full once a table has been migrated."""
+    return FULL_COLUMN if _has_column(cur, table, FULL_COLUMN) else "embedding"
+
+
+def fit_command(conn, model_name: str, config: Dict[str, Any], dim: int):
+    from APIs.embedding_system.backends import backend_namespace
+
+    matrices = []
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            _, matrix = _fetch_vectors(cur, table, _source_column(cur, table))
+            logger.info(f"Loaded {len(matrix)} vectors from {table}")
+            if len(matrix):
+                matrices.append(matrix)
+    if not matrices:
+        raise RuntimeError("No catalog embeddings found to fit the projection")
+
+    projection = PcaProjection.fit(np.vstack(matrices), dim, backend_namespace(model_name, config.get('backend', {})))
+    config = {**config, 'reduction': {**config.get('reduction', {}), 'dim': dim}}
+    path = projection_path(model_name, config)
+    projection.save(path)
+    print(f"Saved {projection.input_dim} -> {dim} projection to {path} "
+          f"(explained variance {projection.explained_variance_ratio.sum():.3f})")
+
+
+def migrate_command(conn, projection: PcaProjection):
+    from psycopg2.extras import execute_batch
+    from APIs.embedding_system.wire import vector_literal
+
+    with conn.cursor() as cur:
+        for table, key in EMBEDDING_TABLES.items():
+            if not _has_column(cur, table, FULL_COLUMN):
+                cur.execute(f"ALTER TABLE {table} RENAME COLUMN embedding TO {FULL_COLUMN}")
+            else:
+                cur.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding")
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN embedding vector({projection.output_dim})")
+
+            ids, matrix = _fetch_vectors(cur, table, FULL_COLUMN)
+            if ids:
+                reduced = projection.transform(matrix)
+                execute_batch(
+                    cur,
+                    f"UPDATE {table} SET embedding = %s::vector WHERE {key} = %s",
+                    [(vector_literal(vector), row_id) for row_id, vector in zip(ids, reduced)],
+                    page_size=500
+                )
+            print(f"{table}: re-projected {len(ids)} rows to {projection.output_dim} dims")
+    conn.commit()
+    # Any vector index moved to embedding_full with the rename
+    print("Run `python -m APIs.recommendation_system.vector_indexes create` to index the reduced columns")
+
+
+def rollback_command(conn):
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            if not _has_column(cur, table, FULL_COLUMN):
+                print(f"{table}: not migrated, skipping")
+                continue
+            cur.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+            cur.execute(f"ALTER TABLE {table} RENAME COLUMN {FULL_COLUMN} TO embedding")
+            print(f"{table}: restored full-width embeddings")
+    conn.commit()
+
+
+def _top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def report_command(conn, projection: PcaProjection, top_k: int, num_queries: int):
+    """Recall@k of reduced search against exact full-width cosine search, per table."""
+    rng = np.random.default_rng(0)
+    print(f"{'table':<12} {'rows':>6} {'recall@' + str(top_k):>10} {'full bytes':>11} {'reduced bytes':>14}")
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            _, full = _fetch_vectors(cur, table, _source_column(cur, table))
+            if len(full) <= top_k:
+                print(f"{table:<12} {len(full):>6} {'n/a':>10}")
+                continue
+            reduced = projection.transform(full)
+            sample = rng.choice(len(full), size=min(num_queries, len(full)), replace=False)
+            # Perturb the queries so a row is not trivially its own nearest neighbour
+            noise = rng.normal(scale=0.05 * float(np.abs(full).mean()), size=(len(sample), full.shape[1]))
+            queries = full[sample] + noise.astype(np.float32)
+            exact = _top_k(queries, full, top_k)
+            approx = _top_k(projection.transform(queries), reduced, top_k)
+            recall = np.mean([len(set(e) & set(a)) / top_k for e, a in zip(exact, approx)])
+            print(f"{table:<12} {len(full):>6} {recall:>10.3f} {full.shape[1] * 4 + 8:>11} {reduced.shape[1] * 4 + 8:>14}")
+
+
+def main():
+    import psycopg2
+    from config_helper import get_db_params, get_embedding_config
+
+    parser = argparse.ArgumentParser(description="Fit, apply and evaluate PCA embedding reduction")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="Fit the projection on the catalog embeddings")
+    fit_parser.add_argument("--dim", type=int, default=None)
+    subparsers.add_parser("migrate", help="Re-project the embedding columns, keeping embedding_full")
+    subparsers.add_parser("rollback", help="Restore embedding_full into embedding")
+    report_parser = subparsers.add_parser("report", help="Recall@k against full-width search")
+    report_parser.add_argument("--top-k", type=int, default=10)
+    report_parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = get_embedding_config()
+    model_name = config.get('model', "Camellia-Mohamed/fine-tuned-sbert-for-tourism")
+
+    conn = psycopg2.connect(**get_db_params())
+    try:
+        if args.command == "fit":
+            fit_command(conn, model_name, config, args.dim or config.get('reduction', {}).get('dim', 128))
+        elif args.command == "rollback":
+            rollback_command(conn)
+        else:
+            path = projection_path(model_name, config)
+            if not os.path.exists(path):
+                print(f"No projection at {path}, run the fit command first")
+                sys.exit(1)
+            projection = PcaProjection.load(path)
+            if args.command == "migrate":
+                migrate_command(conn, projection)
+            else:
+                report_command(conn, projection, args.top_k, args.queries)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
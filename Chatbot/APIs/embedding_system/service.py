@@ -0,0 +1,273 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+from APIs.embedding_system.backends import CHATBOT_DIR, backend_namespace, load_model
+from APIs.embedding_system.batcher import MicroBatcher
+from APIs.embedding_system.cache import EmbeddingCache, normalize_text, text_key
+from APIs.embedding_system.chunking import TokenChunker, split_into_chunks
+from APIs.embedding_system.reduction import PcaProjection, load_projection
+from APIs.embedding_system.store import EmbeddingStore
+from APIs.embedding_system.worker_pool import EmbeddingWorkerPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "Camellia-Mohamed/fine-tuned-sbert-for-tourism"
+
+DEFAULT_WARMUP_PHRASES = [
+    "diving",
+    "pyramids",
+    "I want a relaxing beach holiday in Egypt",
+]
+
+
+class ServiceNotReady(Exception):
+    """Raised when an embedding is requested before the model has finished loading."""
+    pass
+
+
+class EmbeddingService:
+    """
+    Owns the embedding model and everything in front of it: micro-batcher, memory cache,
+    disk store and (optionally) the worker pool.
+
+    ``start()`` returns immediately and loads the model on a background thread, so the
+    process can answer liveness probes while it warms up; ``ready`` flips once the
+    warm-up pass has run.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.model_name = config.get('model', DEFAULT_MODEL)
+        self.backend_config = config.get('backend', {})
+        self.batching_config = config.get('batching', {})
+        self.cache_config = config.get('cache', {})
+        self.store_config = config.get('store', {})
+        self.workers_config = config.get('workers', {})
+        self.lifecycle_config = config.get('lifecycle', {})
+        self.chunking_config = config.get('chunking', {})
+        self.namespace = backend_namespace(self.model_name, self.backend_config)
+
+        self.model = None
+        self.worker_pool: Optional[EmbeddingWorkerPool] = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.store: Optional[EmbeddingStore] = None
+        self.chunker: Optional[TokenChunker] = None
+        self.projection: Optional[PcaProjection] = None
+        self.cache = EmbeddingCache(
+            max_bytes=self.cache_config.get('max_mb', 64) * 1024 * 1024,
+            ttl_seconds=self.cache_config.get('ttl_seconds')
+        )
+
+        self.state = "created"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._ready = threading.Event()
+        # Set once loading has finished either way, so waiters do not sit out a failed load
+        self._settled = threading.Event()
+        self._loader: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self, background: bool = True):
+        if self._loader is not None:
+            return
+        self.state = "starting"
+        if background:
+            self._loader = threading.Thread(target=self._load, name="embedding-loader", daemon=True)
+            self._loader.start()
+        else:
+            self._loader = threading.current_thread()
+            self._load()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        self._settled.wait(timeout)
+        return self.ready
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            step = time.perf_counter()
+            self.state = "loading_store"
+            if self.store_config.get('enabled', True):
+                self.store = EmbeddingStore(
+                    os.path.join(CHATBOT_DIR, self.store_config.get('path', '.embedding_store')),
+                    namespace=self.namespace,
+                    readonly=self.store_config.get('readonly', False)
+                ).open()
+            self.timings['store_load_s'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            self.state = "loading_model"
+            num_workers = self.workers_config.get('count', 0)
+            if num_workers > 0:
+                self.worker_pool = EmbeddingWorkerPool(
+                    self.model_name,
+                    self.backend_config,
+                    num_workers,
+                    threads_per_worker=self.workers_config.get('threads_per_worker'),
+                    pin_cores=self.workers_config.get('pin_cores', True),
+                    job_timeout=self.workers_config.get('job_timeout_seconds', 120),
+                    max_restarts=self.workers_config.get('max_restarts', 3)
+                ).start()
+                encode_fn = self.worker_pool.encode
+                # Workers hold the model; the API process only needs the tokenizer to chunk
+                from transformers import AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                max_seq_length = self.worker_pool.max_seq_length
+            else:
+                self.model = load_model(self.model_name, self.backend_config)
+                encode_fn = self.model.encode
+                tokenizer = self.model.tokenizer
+                max_seq_length = self.model.max_seq_length
+            self.chunker = TokenChunker(
+                tokenizer,
+                max_seq_length,
+                overlap_tokens=self.chunking_config.get('overlap_tokens', 0),
+                max_tokens=self.chunking_config.get('max_tokens')
+            )
+            self.timings['model_load_s'] = time.perf_counter() - step
+
+            # The cache and disk store keep full-width chunk vectors; the projection is
+            # applied after pooling so it can be refitted without invalidating them
+            self.projection = load_projection(self.model_name, self.config)
+
+            self.batcher = MicroBatcher(
+                encode_fn,
+                max_batch_size=self.batching_config.get('max_batch_size', 32),
+                max_wait_ms=self.batching_config.get('max_wait_ms', 5),
+                max_in_flight=max(1, num_workers),
+                timeout_seconds=self.batching_config.get('timeout_seconds', 120)
+            )
+            self.batcher.start()
+
+            step = time.perf_counter()
+            self.state = "warming_up"
+            self._warm_up()
+            self.timings['warmup_s'] = time.perf_counter() - step
+
+            self.timings['total_s'] = time.perf_counter() - started
+            self.state = "ready"
+            self._ready.set()
+            self._record_startup()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Embedding service failed to start: {str(e)}", exc_info=True)
+        finally:
+            self._settled.set()
+
+    def _warm_up(self):
+        """Run the tokenizer and graph once on every model instance before taking traffic."""
+        phrases = self.lifecycle_config.get('warmup_phrases') or DEFAULT_WARMUP_PHRASES
+        if self.worker_pool:
+            self.worker_pool.warm_up(phrases)
+        else:
+            self.model.encode(phrases)
+        # Prime the cache (and disk store) with the phrases themselves
+        self._embed(phrases)
+
+    def _record_startup(self):
+        record = {
+            "release": os.environ.get(self.lifecycle_config.get('release_env', 'APP_RELEASE'), 'unknown'),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "backend": self.namespace,
+            "reduced_dim": self.projection.output_dim if self.projection else None,
+            "workers": self.workers_config.get('count', 0),
+            **{name: round(value, 3) for name, value in self.timings.items()},
+        }
+        logger.info(f"Embedding service ready: {record}")
+        timings_file = self.lifecycle_config.get('timings_file')
+        if not timings_file:
+            return
+        try:
+            timings_path = os.path.join(CHATBOT_DIR, timings_file)
+            os.makedirs(os.path.dirname(timings_path), exist_ok=True)
+            with open(timings_path, 'a') as file:
+                file.write(json.dumps(record) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to record startup timings: {str(e)}")
+
+    def stop(self):
+        if self.batcher:
+            self.batcher.stop()
+        if self.worker_pool:
+            self.worker_pool.stop()
+        self._ready.clear()
+        self.state = "stopped"
+
+    def encode_chunks(self, chunks: List[str]) -> List[np.ndarray]:
+        """Encode chunks, serving known ones from the cache or disk store and batching the rest."""
+        keys = [text_key(chunk) for chunk in chunks]
+        vectors = self.cache.get_many(keys)
+
+        resolved = {}
+        to_encode = {}
+        for chunk, key, vector in zip(chunks, keys, vectors):
+            if vector is not None or key in resolved or key in to_encode:
+                continue
+            stored = self.store.get(key) if self.store else None
+            if stored is not None:
+                self.cache.put(key, stored)
+                resolved[key] = stored
+            else:
+                to_encode[key] = chunk
+
+        if to_encode:
+            encoded = self.batcher.encode(list(to_encode.values()))
+            for key, vector in zip(to_encode.keys(), encoded):
+                self.cache.put(key, vector)
+                resolved[key] = vector
+            if self.store:
+                self.store.put_many(list(to_encode.keys()), list(encoded))
+
+        return [vector if vector is not None else resolved[key] for key, vector in zip(keys, vectors)]
+
+    def _embed(self, texts: List[str]) -> List[np.ndarray]:
+        all_chunks = []
+        offsets = []
+        for text in texts:
+            text = normalize_text(text, lowercase=self.cache_config.get('lowercase', False))
+            chunks = (self.chunker.split(text) if self.chunker else split_into_chunks(text)) or [text]
+            offsets.append((len(all_chunks), len(all_chunks) + len(chunks)))
+            all_chunks.extend(chunks)
+
+        if not all_chunks:
+            return []
+
+        chunk_embeddings = np.stack(self.encode_chunks(all_chunks))
+        embeddings = np.stack([np.mean(chunk_embeddings[start:end], axis=0) for start, end in offsets])
+        if self.projection is not None:
+            embeddings = self.projection.transform(embeddings)
+        return list(embeddings)
+
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed several texts in one micro-batched forward pass, preserving input order."""
+        if not self.ready:
+            raise ServiceNotReady(f"Embedding service is {self.state}")
+        return self._embed(texts)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "backend": self.namespace,
+            "dimension": self.projection.output_dim if self.projection else None,
+            "timings": {name: round(value, 3) for name, value in self.timings.items()},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batching": self.batcher.stats() if self.batcher else {},
+            "cache": self.cache.stats(),
+            "store": self.store.stats() if self.store else {"enabled": False},
+            "workers": self.worker_pool.stats() if self.worker_pool else {"workers": 0},
+        }
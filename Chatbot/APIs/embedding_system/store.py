@@ -0,0 +1,236 @@
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: fall back to a single unlocked writer
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+VECTOR_DTYPE = np.dtype('<f4')
+STORE_VERSION = 1
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store shared between processes.
+
+    Layout inside ``path``:
+      - ``vectors.f32``: raw little-endian float32 rows, memory-mapped read-only
+      - ``keys.bin``: one 16-byte content key per row, in the same order
+      - ``meta.json``: model namespace and vector dimension
+
+    Rows are appended under an exclusive file lock, vector first and key second, so a
+    reader never sees a key whose vector is not fully written. Readers only rebuild the
+    key -> row index for the tail that appeared since their last refresh; the larger
+    memmap is published before the new keys, so a concurrent ``get()`` that finds a key
+    always finds its row.
+    """
+
+    def __init__(self, path: str, namespace: str, readonly: bool = False, refresh_interval: float = 1.0):
+        self.path = path
+        self.namespace = namespace
+        self.readonly = readonly
+        self.refresh_interval = refresh_interval
+        self.dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._rows = 0
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.enabled = False
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.path, "keys.bin")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def open(self) -> "EmbeddingStore":
+        """Load the index and map the vector file. Returns self for chaining."""
+        start_time = time.time()
+        try:
+            if not self.readonly:
+                os.makedirs(self.path, exist_ok=True)
+            meta = self._read_meta()
+            if meta and meta.get("namespace") != self.namespace:
+                if self.readonly:
+                    logger.warning(f"Embedding store at {self.path} belongs to {meta.get('namespace')}, not using it")
+                    return self
+                logger.warning(f"Embedding store at {self.path} belongs to {meta.get('namespace')}, resetting it")
+                self._reset()
+                meta = None
+            if meta:
+                self.dim = meta.get("dim")
+            self.enabled = True
+            self._refresh(force=True)
+            logger.info(f"Embedding store loaded {self._rows} vectors in {(time.time() - start_time) * 1000:.1f}ms")
+        except Exception as e:
+            logger.error(f"Failed to open embedding store at {self.path}: {str(e)}")
+            self.enabled = False
+        return self
+
+    def _read_meta(self) -> Optional[dict]:
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, 'r') as file:
+            return json.load(file)
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({"namespace": self.namespace, "dim": self.dim, "version": STORE_VERSION}, file)
+        os.replace(tmp_path, self._meta_path)
+
+    def _reset(self):
+        with self._locked():
+            for file_path in (self._vectors_path, self._keys_path, self._meta_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+        self.dim = None
+        self._index = {}
+        self._vectors = None
+        self._rows = 0
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, ".lock"), 'a+') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _complete_rows(self) -> int:
+        """Rows that have both a key and a fully written vector."""
+        if not self.dim or not os.path.exists(self._keys_path) or not os.path.exists(self._vectors_path):
+            return 0
+        key_rows = os.path.getsize(self._keys_path) // KEY_SIZE
+        vector_rows = os.path.getsize(self._vectors_path) // (self.dim * VECTOR_DTYPE.itemsize)
+        return min(key_rows, vector_rows)
+
+    def _refresh(self, force: bool = False):
+        # Executor threads call get() concurrently; only one of them extends the index at a time
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = now
+
+            if self.dim is None:
+                meta = self._read_meta()
+                if not meta or meta.get("namespace") != self.namespace:
+                    return
+                self.dim = meta.get("dim")
+
+            rows = self._complete_rows()
+            if rows <= self._rows:
+                return
+
+            with open(self._keys_path, 'rb') as file:
+                file.seek(self._rows * KEY_SIZE)
+                new_keys = file.read((rows - self._rows) * KEY_SIZE)
+
+            # Map the longer file before any new key becomes visible to get()
+            self._vectors = np.memmap(self._vectors_path, dtype=VECTOR_DTYPE, mode='r', shape=(rows, self.dim))
+            for offset in range(0, len(new_keys), KEY_SIZE):
+                self._index.setdefault(new_keys[offset:offset + KEY_SIZE], self._rows + offset // KEY_SIZE)
+            self._rows = rows
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        row = self._index.get(key)
+        if row is None:
+            self._refresh()
+            row = self._index.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._vectors[row]
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        return [self.get(key) for key in keys]
+
+    def put_many(self, keys: List[bytes], vectors: List[np.ndarray]):
+        """Append vectors that are not stored yet. No-op for read-only stores."""
+        if not self.enabled or self.readonly or not keys:
+            return
+        matrix = np.ascontiguousarray(np.stack(vectors), dtype=VECTOR_DTYPE)
+        try:
+            with self._locked():
+                if self.dim is None:
+                    self.dim = int(matrix.shape[1])
+                    self._write_meta()
+                elif matrix.shape[1] != self.dim:
+                    logger.error(f"Refusing to store {matrix.shape[1]}-d vectors in a {self.dim}-d store")
+                    return
+
+                self._refresh(force=True)
+                rows = self._complete_rows()
+                if rows < self._rows:
+                    # Another process reset or shrank the store; rebuild the index from what is on disk
+                    logger.warning(f"Embedding store at {self.path} shrank from {self._rows} to {rows} rows, reloading it")
+                    with self._refresh_lock:
+                        self._index = {}
+                        self._rows = 0
+                    self._refresh(force=True)
+                    rows = self._rows
+                # Drop any torn tail left by a writer that died between the vector and key writes.
+                # Sizes come from the files themselves and are only ever cut, never extended.
+                row_bytes = self.dim * VECTOR_DTYPE.itemsize
+                for file_path, size in ((self._vectors_path, rows * row_bytes), (self._keys_path, rows * KEY_SIZE)):
+                    if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                        os.truncate(file_path, size)
+
+                new_rows = []
+                seen = set()
+                for position, key in enumerate(keys):
+                    if key not in self._index and key not in seen:
+                        seen.add(key)
+                        new_rows.append(position)
+                if not new_rows:
+                    return
+
+                with open(self._vectors_path, 'ab') as file:
+                    file.write(matrix[new_rows].tobytes())
+                with open(self._keys_path, 'ab') as file:
+                    file.write(b"".join(keys[position] for position in new_rows))
+                self.writes += len(new_rows)
+                self._refresh(force=True)
+        except Exception as e:
+            logger.error(f"Failed to append to embedding store: {str(e)}")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "readonly": self.readonly,
+            "path": self.path,
+            "vectors": self._rows,
+            "dim": self.dim,
+            "bytes": self._rows * (self.dim or 0) * VECTOR_DTYPE.itemsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+        }
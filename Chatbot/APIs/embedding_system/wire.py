@@ -0,0 +1,75 @@
+from typing import Mapping, Optional
+import json
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, clients fall back to raw float32 or JSON
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+FLOAT32_MEDIA_TYPE = "application/octet-stream"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+DIM_HEADER = "X-Embedding-Dim"
+COUNT_HEADER = "X-Embedding-Count"
+
+WIRE_DTYPE = np.dtype('<f4')
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Pick the response format from an Accept header, defaulting to JSON."""
+    if not accept:
+        return JSON_MEDIA_TYPE
+    for part in accept.split(','):
+        media_type = part.split(';')[0].strip().lower()
+        if media_type == FLOAT32_MEDIA_TYPE:
+            return FLOAT32_MEDIA_TYPE
+        if media_type == MSGPACK_MEDIA_TYPE and msgpack is not None:
+            return MSGPACK_MEDIA_TYPE
+        if media_type in (JSON_MEDIA_TYPE, "*/*"):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode_embeddings(matrix: np.ndarray, media_type: str) -> bytes:
+    """Serialize a (count, dim) matrix for a binary media type."""
+    matrix = np.ascontiguousarray(matrix, dtype=WIRE_DTYPE)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        count, dim = matrix.shape
+        return msgpack.packb({"count": count, "dim": dim, "data": matrix.tobytes()})
+    return matrix.tobytes()
+
+
+def decode_embedding_response(body: bytes, headers: Mapping[str, str]) -> np.ndarray:
+    """
+    Decode any embedding endpoint response into a (count, dim) float32 array.
+
+    Binary formats are wrapped with np.frombuffer, so no per-float Python objects are created.
+    """
+    media_type = (headers.get("Content-Type") or JSON_MEDIA_TYPE).split(';')[0].strip().lower()
+
+    if media_type == FLOAT32_MEDIA_TYPE:
+        vectors = np.frombuffer(body, dtype=WIRE_DTYPE)
+        dim = int(headers.get(DIM_HEADER) or vectors.size)
+        return vectors.reshape(-1, dim) if dim else vectors.reshape(0, 0)
+
+    if media_type == MSGPACK_MEDIA_TYPE:
+        if msgpack is None:
+            raise ValueError("Received a msgpack embedding response but msgpack is not installed")
+        payload = msgpack.unpackb(body)
+        return np.frombuffer(payload["data"], dtype=WIRE_DTYPE).reshape(payload["count"], payload["dim"])
+
+    payload = json.loads(body)
+    if "embeddings" in payload:
+        return np.asarray(payload["embeddings"], dtype=np.float32)
+    if "embedding" in payload:
+        return np.asarray([payload["embedding"]], dtype=np.float32)
+    raise ValueError("Invalid embedding response format")
+
+
+def vector_literal(embedding) -> str:
+    """Format an embedding as a pgvector text literal for ``%s::vector`` parameters."""
+    values = np.asarray(embedding, dtype=np.float32)
+    # float32 needs 9 significant digits to round-trip exactly
+    return "[" + ",".join(np.char.mod("%.9g", values)) + "]"
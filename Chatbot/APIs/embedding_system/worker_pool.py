@@ -0,0 +1,265 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _worker_main(worker_id: int, cores: List[int], num_threads: int, model_name: str,
+                 backend_config: Dict[str, Any], requests: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Model worker process: pin to its core slice, load the model and serve encode jobs."""
+    # Thread pools read these when the runtime is first imported, so set them before loading anything
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    from APIs.embedding_system.backends import load_model
+
+    try:
+        model = load_model(model_name, backend_config, num_threads=num_threads)
+    except Exception as e:
+        results.put((None, worker_id, None, f"Failed to load model: {str(e)}"))
+        return
+    results.put((None, worker_id, {"max_seq_length": model.max_seq_length}, None))
+
+    while True:
+        job = requests.get()
+        if job is None:
+            break
+        job_id, texts = job
+        try:
+            vectors = np.asarray(model.encode(texts), dtype=np.float32)
+            results.put((job_id, worker_id, vectors, None))
+        except Exception as e:
+            results.put((job_id, worker_id, None, str(e)))
+
+
+class EmbeddingWorkerPool:
+    """
+    Pool of model worker processes, each pinned to its own slice of cores.
+
+    Jobs go to the worker with the fewest jobs in flight, so a slow batch on one worker
+    does not hold up the others. A worker that dies (OOM, a crash inside the runtime) has
+    its pending jobs failed and is taken out of dispatch while it is respawned, up to
+    ``max_restarts`` times; ``encode()`` gives up on a job after ``job_timeout``.
+    """
+
+    def __init__(self, model_name: str, backend_config: Dict[str, Any], num_workers: int,
+                 threads_per_worker: Optional[int] = None, pin_cores: bool = True,
+                 job_timeout: float = 120, max_restarts: int = 3):
+        self.model_name = model_name
+        self.backend_config = backend_config
+        self.num_workers = max(1, int(num_workers))
+        cores = available_cores()
+        slice_size = max(1, len(cores) // self.num_workers)
+        self.core_slices = []
+        for worker_id in range(self.num_workers):
+            # More workers than cores wraps around and shares cores
+            start = (worker_id * slice_size) % len(cores)
+            self.core_slices.append(cores[start:start + slice_size] if pin_cores else [])
+        self.threads_per_worker = threads_per_worker or slice_size
+        self.job_timeout = job_timeout
+        self.max_restarts = max_restarts
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * self.num_workers
+        self._request_queues = [None] * self.num_workers
+        self._results = None
+        self._available = [False] * self.num_workers
+        self._in_flight = [0] * self.num_workers
+        self._completed = [0] * self.num_workers
+        self._restarts = [0] * self.num_workers
+        self._futures: Dict[int, Tuple[int, Future]] = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader = None
+        self._running = False
+        self.max_seq_length: Optional[int] = None
+
+    def _spawn(self, worker_id: int):
+        requests = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.core_slices[worker_id], self.threads_per_worker, self.model_name,
+                  self.backend_config, requests, self._results),
+            name=f"embedding-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._request_queues[worker_id] = requests
+
+    def start(self, timeout: float = 600) -> "EmbeddingWorkerPool":
+        """Spawn the workers and block until every one has loaded its model."""
+        self._results = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while ready < self.num_workers:
+            remaining = deadline - time.monotonic()
+            try:
+                _, worker_id, info, error = self._results.get(timeout=max(0.1, min(1.0, remaining)))
+            except queue.Empty:
+                dead = [worker_id for worker_id, process in enumerate(self._processes) if not process.is_alive()]
+                if dead or remaining <= 0:
+                    self.stop()
+                    reason = (f"worker {dead[0]} exited while loading the model" if dead
+                              else f"workers did not load the model within {timeout}s")
+                    raise RuntimeError(f"Embedding worker pool failed to start: {reason}")
+                continue
+            if error:
+                self.stop()
+                raise RuntimeError(f"Embedding worker {worker_id}: {error}")
+            self.max_seq_length = info["max_seq_length"]
+            self._available[worker_id] = True
+            ready += 1
+
+        self._running = True
+        self._reader = threading.Thread(target=self._read_results, name="embedding-pool-results", daemon=True)
+        self._reader.start()
+        logger.info(f"Embedding worker pool started with {self.num_workers} workers, "
+                    f"{self.threads_per_worker} threads each, cores {self.core_slices}")
+        return self
+
+    def _read_results(self):
+        last_check = time.monotonic()
+        while self._running:
+            if time.monotonic() - last_check >= 0.5:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                job_id, worker_id, payload, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if job_id is None:
+                # A respawned worker finished (or failed) loading its model
+                if error:
+                    logger.error(f"Embedding worker {worker_id} failed to restart: {error}")
+                else:
+                    with self._lock:
+                        self._available[worker_id] = True
+                    logger.info(f"Embedding worker {worker_id} is back in rotation")
+                continue
+            with self._lock:
+                entry = self._futures.pop(job_id, None)
+                if entry is not None:
+                    # Jobs already failed with a dead worker or abandoned after a timeout were uncounted then
+                    self._in_flight[worker_id] -= 1
+                    self._completed[worker_id] += 1
+            if entry is None:
+                continue
+            future = entry[1]
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(payload)
+
+    def _check_workers(self):
+        """Fail the jobs of workers that died and respawn them out of dispatch."""
+        for worker_id, process in enumerate(self._processes):
+            if process is None or process.is_alive():
+                continue
+            with self._lock:
+                lost = [job_id for job_id, (owner, _) in self._futures.items() if owner == worker_id]
+                futures = [self._futures.pop(job_id)[1] for job_id in lost]
+                self._in_flight[worker_id] = 0
+                self._available[worker_id] = False
+            logger.error(f"Embedding worker {worker_id} exited with code {process.exitcode}, "
+                         f"failing {len(futures)} pending jobs")
+            for future in futures:
+                future.set_exception(RuntimeError(f"Embedding worker {worker_id} exited"))
+            if self._restarts[worker_id] >= self.max_restarts:
+                logger.error(f"Embedding worker {worker_id} restarted {self.max_restarts} times, leaving it out")
+                self._processes[worker_id] = None
+                continue
+            self._restarts[worker_id] += 1
+            self._spawn(worker_id)
+
+    def submit(self, texts: List[str], worker_id: Optional[int] = None) -> Future:
+        future = Future()
+        with self._lock:
+            if worker_id is None:
+                candidates = [i for i in range(self.num_workers) if self._available[i]]
+                if not candidates:
+                    raise RuntimeError("No embedding worker is available")
+                worker_id = min(candidates, key=lambda i: self._in_flight[i])
+            self._in_flight[worker_id] += 1
+            job_id = next(self._job_ids)
+            self._futures[job_id] = (worker_id, future)
+        self._request_queues[worker_id].put((job_id, list(texts)))
+        return future
+
+    def _abandon(self, future: Future):
+        with self._lock:
+            for job_id, (worker_id, pending) in list(self._futures.items()):
+                if pending is future:
+                    del self._futures[job_id]
+                    self._in_flight[worker_id] -= 1
+                    break
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        future = self.submit(texts)
+        try:
+            return future.result(timeout=self.job_timeout)
+        except FutureTimeoutError:
+            self._abandon(future)
+            raise RuntimeError(f"Embedding worker did not answer within {self.job_timeout}s")
+
+    def warm_up(self, texts: List[str]):
+        """Send the same texts to every worker so each one has run its graph once."""
+        futures = [self.submit(texts, worker_id=worker_id) for worker_id in range(self.num_workers)]
+        for future in futures:
+            future.result(timeout=self.job_timeout)
+
+    def stop(self):
+        self._running = False
+        for requests in self._request_queues:
+            try:
+                if requests is not None:
+                    requests.put(None)
+            except Exception:
+                pass
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self._reader:
+            self._reader.join(timeout=2)
+        with self._lock:
+            for _, future in self._futures.values():
+                future.set_exception(RuntimeError("Embedding worker pool stopped"))
+            self._futures.clear()
+            self._available = [False] * self.num_workers
+        self._processes = [None] * self.num_workers
+        self._request_queues = [None] * self.num_workers
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "threads_per_worker": self.threads_per_worker,
+                "cores": self.core_slices,
+                "available": list(self._available),
+                "in_flight": list(self._in_flight),
+                "completed": list(self._completed),
+                "restarts": list(self._restarts),
+            }
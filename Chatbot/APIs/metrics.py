@@ -0,0 +1,35 @@
+"""Metrics helpers shared by the embedding service and the recommendation API."""
+from typing import Dict
+import threading
+
+
+class Histogram:
+    """Thread-safe histogram with power-of-two buckets."""
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._total = 0
+        self._sum = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(value: int) -> int:
+        bucket = 1
+        while bucket < value:
+            bucket *= 2
+        return bucket
+
+    def observe(self, value: int):
+        bucket = self._bucket(value) if value > 0 else 0
+        with self._lock:
+            self._counts[bucket] = self._counts.get(bucket, 0) + 1
+            self._total += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "count": self._total,
+                "mean": round(self._sum / self._total, 2) if self._total else 0.0,
+                "buckets": {f"<={bucket}": count for bucket, count in sorted(self._counts.items())},
+            }
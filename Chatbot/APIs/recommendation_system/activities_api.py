@@ -1,24 +1,41 @@
-import aiohttp
-from config_helper import get_api_urls
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Depends
+from APIs.embedding_system.wire import vector_literal
+from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import logging
 from .db_manager import db_manager
+from .embedding_client import embedding_client
+from .city_resolver import city_resolver
+from .catalog_index import CityVectorIndex, catalog_indexes
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(db_manager.query_scope("activities"))])
 logger = logging.getLogger(__name__)
 
-EMBEDDING_API_URL = get_api_urls().get('embedding')
-
-ACTIVITY_QUERY = """
-    SELECT activity_id, A.name, A.description, 1 - (A.embedding <=> %s::vector) AS similarity, 
-           price, A.duration_in_hours, A.img,A.category, S.name as state_name
-    FROM activities A 
+# Top 50 activities for every query vector in one round trip, tagged with the
+# 1-based position of the vector that matched them. Ranked by exact similarity over the
+# city's rows: an HNSW scan would filter by city after collecting ef_search candidates
+# and could return far fewer than 50. The vectors arrive as vector[], so each is parsed
+# once rather than cast from text for every candidate row
+ACTIVITY_QUERY = db_manager.register_statement("activity_search", """
+    SELECT q.preference, m.*
+    FROM unnest(%s::vector[]) WITH ORDINALITY AS q(query_vector, preference)
+    CROSS JOIN LATERAL (
+        SELECT activity_id, A.name, A.description, 1 - (A.embedding <=> q.query_vector) AS similarity, 
+               price, A.duration_in_hours, A.img,A.category, S.name as state_name
+        FROM activities A 
+        JOIN states S ON A.state_id = S.state_id
+        WHERE A.state_id = ANY(%s)
+        ORDER BY similarity DESC limit 50
+    ) m
+""")
+
+# Same columns as ACTIVITY_QUERY's matches without the similarity, for the in-memory per-city index
+ACTIVITY_INDEX = catalog_indexes.register(CityVectorIndex("activities", """
+    SELECT A.state_id, activity_id, A.name, A.description, price, A.duration_in_hours, A.img, A.category,
+           S.name as state_name, A.embedding::real[]
+    FROM activities A
     JOIN states S ON A.state_id = S.state_id
-    WHERE lower(S.name) LIKE %s 
-    ORDER BY similarity desc limit 50
-"""
+"""))
 
 class ActivityRequestByText(BaseModel):
     city_name: str
@@ -35,6 +52,7 @@ class ActivityResponse(BaseModel):
     state: str
     img: str = None
     category: str
+    matched_preference: Optional[str] = None
 
 def convert_row_to_dict(row: tuple) -> Dict[str, Any]:
     """Convert database row to dictionary format."""
@@ -54,88 +72,64 @@ def convert_row_to_dict(row: tuple) -> Dict[str, Any]:
         logger.error(f"Error converting row to dict: {str(e)}")
         raise
 
-async def get_embedding(text: str) -> Optional[List[float]]:
-    """Get embedding for text using the embedding API."""
-    if not text or not text.strip():
-        return None
-        
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                EMBEDDING_API_URL,
-                json={"text": text},
-                timeout=30  # Increased timeout
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get('embedding')
-                return None
-    except Exception as e:
-        logger.error(f"Error getting embedding: {str(e)}")
-        return None
+async def search_activities(city_name: str, texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Embed every text in one call, then find the best activities for all of them in one search.
 
-async def get_activities_by_text(conn, city_name: str, user_message: str) -> List[Dict[str, Any]]:
-    """Get activities based on user message similarity."""
-    try:
-        embedding = await get_embedding(user_message)
-        if not embedding:
-            return []
-            
-        with conn.cursor() as cursor:
-            cursor.execute(ACTIVITY_QUERY, (embedding, f'%{city_name.lower()}%'))
-            return [convert_row_to_dict(row) for row in cursor.fetchall()]
-    except Exception as e:
-        logger.error(f"Error in get_activities_by_text: {str(e)}")
+    Each activity is returned once, with its best score and the text that matched it.
+    """
+    texts = [text for text in texts if text and text.strip()]
+    if not texts:
         return []
 
-async def get_activities_by_user_activities(conn, city_name: str, user_activities: List[str]) -> List[Dict[str, Any]]:
-    """Get activities based on user preferred activities."""
-    try:
-        activities_list = []
-        with conn.cursor() as cursor:
-            for activity in user_activities:
-                embedding = await get_embedding(activity)
-                if not embedding:
-                    continue
-                    
-                cursor.execute(ACTIVITY_QUERY, (embedding, f'%{city_name.lower()}%'))
-                activities_list.extend(convert_row_to_dict(row) for row in cursor.fetchall())
-                
-        return list({activity['id']: activity for activity in activities_list}.values())
-    except Exception as e:
-        logger.error(f"Error in get_activities_by_user_activities: {str(e)}")
+    state_ids = await city_resolver.resolve(city_name)
+    if not state_ids:
         return []
 
+    embeddings = await embedding_client.embed_batch(texts)
+    if embeddings is None:
+        return []
+
+    matches = ACTIVITY_INDEX.search(state_ids, embeddings, 50)
+    if matches is not None:
+        rows = [
+            (preference, *item[:3], similarity, *item[3:])
+            for preference, pairs in enumerate(matches, start=1) for item, similarity in pairs
+        ]
+    else:
+        async with db_manager.get_connection(readonly=True) as conn:
+            rows = await db_manager.fetch_all(
+                conn, "activity_search", ACTIVITY_QUERY, ([vector_literal(embedding) for embedding in embeddings], state_ids)
+            )
+
+    best: Dict[int, Dict[str, Any]] = {}
+    for preference, *row in rows:
+        activity = convert_row_to_dict(tuple(row))
+        activity['matched_preference'] = texts[preference - 1]
+        if activity['id'] not in best or activity['score'] > best[activity['id']]['score']:
+            best[activity['id']] = activity
+    return list(best.values())
+
 @router.post("/recommend", response_model=Dict[str, List[ActivityResponse]])
 async def get_activities(request: ActivityRequestByText):
     """Search for activities based on a user message and preferred activities."""
     try:
-        async with db_manager.get_connection() as conn:
-            # Get activities by message
-            activities_by_message = await get_activities_by_text(conn, request.city_name, request.user_message)
-
-            # Get activities by user preferences
-            activities_by_user_activities = []
-            if request.preferred_activities:
-                activities_by_user_activities = await get_activities_by_user_activities(
-                    conn, request.city_name, request.preferred_activities
-                )
-
-            # Combine and deduplicate results
-            activity_list = activities_by_message + activities_by_user_activities
-            activity_list = list({activity['id']: activity for activity in activity_list}.values())
-            
-            # Sort by similarity score
-            activity_list.sort(key=lambda x: x['score'], reverse=True)
-
-            if not activity_list:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No activities found in {request.city_name}"
-                )
-
-            return {"activities": activity_list}
-            
+        # The message and every preferred activity are searched together
+        activity_list = await search_activities(
+            request.city_name, [request.user_message, *request.preferred_activities]
+        )
+
+        # Sort by similarity score
+        activity_list.sort(key=lambda x: x['score'], reverse=True)
+
+        if not activity_list:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No activities found in {request.city_name}"
+            )
+
+        return {"activities": activity_list}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,251 @@
+"""
+In-memory per-city vector indexes for the small, rarely changing catalog tables.
+
+Each ``CityVectorIndex`` keeps, for every state, the catalog embeddings as one
+contiguous, L2-normalised float32 matrix plus the matching metadata rows, so a top-k
+cosine search for any number of query vectors is a single matrix multiply and an
+``argpartition``. Routers call ``search()`` and fall back to their SQL query whenever it
+returns None (index not loaded yet, unknown state, dimension mismatch).
+
+Indexes are reloaded every ``catalog_index.refresh_seconds`` and, with ``listen``
+enabled, shortly after a ``NOTIFY`` on ``catalog_index.channel``. The triggers that send
+those notifications are installed with:
+    python -m APIs.recommendation_system.catalog_index install-triggers
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import asyncio
+import logging
+import time
+import numpy as np
+import psycopg
+from config_helper import get_catalog_index_config
+from db_pool import connection_kwargs
+from .db_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype=np.float32)
+
+
+class CityMatrix:
+    """One state's rows: a normalised embedding matrix and the metadata for each row."""
+
+    def __init__(self, items: List[tuple], vectors: np.ndarray):
+        self.items = items
+        self.matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+
+    def top_k(self, queries: np.ndarray, k: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Row indices and cosine similarities of the best ``k`` rows (all rows if None) per query, best first."""
+        scores = queries @ self.matrix.T
+        rows = scores.shape[1]
+        if k is not None and k < rows:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.broadcast_to(np.arange(rows), scores.shape)
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class CityVectorIndex:
+    """
+    Per-state vector index over one catalog table.
+
+    ``load_query`` must return ``state_id`` first, the embedding as ``real[]`` last, and
+    the metadata columns the router needs in between.
+    """
+
+    def __init__(self, table: str, load_query: str):
+        self.table = table
+        self.load_query = load_query
+        self._cities: Dict[int, CityMatrix] = {}
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self.loaded_at = 0.0
+        self.reloads = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at > 0
+
+    async def load(self):
+        started = time.perf_counter()
+        async with db_manager.get_connection(readonly=True) as conn:
+            rows = await db_manager.fetch_all(conn, f"{self.table}_index_load", self.load_query)
+
+        grouped: Dict[int, Tuple[List[tuple], List[Sequence[float]]]] = {}
+        for row in rows:
+            if row[-1] is None:
+                continue
+            items, vectors = grouped.setdefault(row[0], ([], []))
+            items.append(tuple(row[1:-1]))
+            vectors.append(row[-1])
+        cities = {state_id: CityMatrix(items, np.asarray(vectors, dtype=np.float32))
+                  for state_id, (items, vectors) in grouped.items()}
+
+        # Swap in the new matrices in one assignment so searches never see a half-built index
+        self._cities = cities
+        self.dim = next(iter(cities.values())).matrix.shape[1] if cities else None
+        self.rows = sum(len(city.items) for city in cities.values())
+        self.loaded_at = time.monotonic()
+        self.reloads += 1
+        logger.info(f"Loaded {self.rows} {self.table} rows for {len(cities)} states into memory "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def search(self, state_ids: List[int], queries: Sequence[np.ndarray],
+               k: Optional[int]) -> Optional[List[List[Tuple[tuple, float]]]]:
+        """
+        Top-k (metadata, similarity) pairs per query vector across ``state_ids``.
+
+        Returns None when the index cannot answer, so the caller runs its SQL query.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if (not self.ready or queries.ndim != 2 or queries.shape[1] != self.dim
+                or any(state_id not in self._cities for state_id in state_ids)):
+            self.misses += 1
+            return None
+        queries = _normalize(queries)
+
+        results: List[List[Tuple[tuple, float]]] = [[] for _ in range(len(queries))]
+        for state_id in state_ids:
+            city = self._cities[state_id]
+            indices, scores = city.top_k(queries, k)
+            for result, row_indices, row_scores in zip(results, indices, scores):
+                result.extend((city.items[i], float(score)) for i, score in zip(row_indices, row_scores))
+        if len(state_ids) > 1:
+            results = [sorted(result, key=lambda pair: pair[1], reverse=True)[:k] for result in results]
+        self.hits += 1
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "states": len(self._cities),
+            "rows": self.rows,
+            "dimension": self.dim,
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.ready else None,
+            "reloads": self.reloads,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CatalogIndexes:
+    """Loads the registered indexes and keeps them fresh on a schedule and on NOTIFY."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.enabled = config.get('enabled', True)
+        self.refresh_seconds = config.get('refresh_seconds', 900)
+        self.listen = config.get('listen', False)
+        self.channel = config.get('channel', "catalog_changed")
+        self.debounce_seconds = config.get('debounce_seconds', 1)
+        self._indexes: Dict[str, CityVectorIndex] = {}
+        self._pending = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, index: CityVectorIndex) -> CityVectorIndex:
+        self._indexes[index.table] = index
+        return index
+
+    async def _reload(self, tables):
+        for table in tables:
+            try:
+                await self._indexes[table].load()
+            except Exception as e:
+                logger.error(f"Failed to load the in-memory {table} index, searches use SQL: {str(e)}")
+
+    async def start(self):
+        if not self.enabled or self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._refresh_loop()))
+        if self.listen:
+            self._tasks.append(asyncio.create_task(self._listen_loop()))
+
+    async def _refresh_loop(self):
+        # The first load runs here, not in start(), so a database outage does not hold up startup
+        await self._reload(list(self._indexes))
+        while True:
+            # Indexes that failed to load are retried well before the regular refresh
+            loaded = all(index.ready for index in self._indexes.values())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_seconds if loaded else self.refresh_seconds / 10)
+                # Let a burst of catalog writes settle into one reload
+                await asyncio.sleep(self.debounce_seconds)
+                self._wake.clear()
+                tables, self._pending = self._pending, set()
+            except asyncio.TimeoutError:
+                tables = set(self._indexes)
+            await self._reload(sorted(tables))
+
+    async def _listen_loop(self):
+        """Wait for change notifications on a dedicated connection to the primary."""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**connection_kwargs(), autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    logger.info(f"Listening for catalog changes on {self.channel}")
+                    async for notify in conn.notifies():
+                        if notify.payload in self._indexes:
+                            self._pending.add(notify.payload)
+                            self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog change listener failed, retrying: {str(e)}")
+                await asyncio.sleep(self.refresh_seconds / 10)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {table: index.stats() for table, index in self._indexes.items()}
+
+
+catalog_indexes = CatalogIndexes(get_catalog_index_config())
+
+
+def install_triggers(conn, tables: List[str], channel: str):
+    """Statement-level triggers that NOTIFY ``channel`` with the table name after any write."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION notify_catalog_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{channel}', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        for table in tables:
+            cur.execute(f"DROP TRIGGER IF EXISTS {table}_catalog_changed ON {table}")
+            cur.execute(f"""
+                CREATE TRIGGER {table}_catalog_changed
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_changed()
+            """)
+            print(f"{table}: notifies {channel} on change")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage change notifications for the in-memory catalog indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    install_parser = subparsers.add_parser("install-triggers", help="NOTIFY the API when catalog tables change")
+    install_parser.add_argument("--tables", default="activities,landmarks")
+    args = parser.parse_args()
+
+    with psycopg.connect(**connection_kwargs()) as conn:
+        install_triggers(conn, [table for table in args.tables.split(",") if table], catalog_indexes.channel)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,14 @@
 from typing import List, Dict, Any
-import aiohttp
-from pydantic import BaseModel, Field
-from config_helper import get_db_params, get_api_urls
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import json
+from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends
+from APIs.embedding_system.wire import vector_literal
 import logging
-from contextlib import asynccontextmanager
+from .db_manager import db_manager
+from .embedding_client import embedding_client
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(db_manager.query_scope("cities"))])
 logger = logging.getLogger(__name__)
 
-EMBEDDING_API_URL = get_api_urls().get('embedding')
-DB_Prams = get_db_params()
-
 # Define common features and their keywords with weights
 FEATURES = {
     'sea': {
@@ -90,54 +85,6 @@ def extract_features(text: str) -> List[Dict[str, Any]]:
     
     return found_features
 
-@asynccontextmanager
-async def get_db_connection():
-    """Create and manage a database connection."""
-    conn = None
-    try:
-        conn = psycopg2.connect(**DB_Prams)
-        yield conn
-    except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    finally:
-        if conn:
-            conn.close()
-
-async def get_embedding(text: str) -> List[float]:
-    """Get embedding for text using the embedding API."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                EMBEDDING_API_URL,
-                json={"text": text},
-                timeout=10
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Failed to get embedding from embedding service"
-                    )
-                
-                result = await response.json()
-                if "embedding" not in result:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Invalid embedding response format"
-                    )
-                return result["embedding"]
-    except aiohttp.ClientTimeout:
-        raise HTTPException(
-            status_code=504,
-            detail="Embedding service timeout"
-        )
-    except aiohttp.ClientError as e:
-        logger.error(f"Embedding API error: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail="Error calling embedding service"
-        )
-
 @router.post("/recommend", response_model=Dict[str, List[CityResponse]])
 async def get_cities(request: CityRequest):
     """
@@ -150,7 +97,12 @@ async def get_cities(request: CityRequest):
         logger.info(f"Extracted features: {features}")
         
         # Get the user messages embedding
-        user_msgs_embedding = await get_embedding(request.city_description)
+        user_msgs_embedding = await embedding_client.embed(request.city_description)
+        if user_msgs_embedding is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Failed to get embedding from embedding service"
+            )
         
         # Base query with semantic similarity
         base_query = """
@@ -194,7 +146,7 @@ async def get_cities(request: CityRequest):
         """
         
         # Prepare parameters for the query
-        params = [user_msgs_embedding]
+        params = [vector_literal(user_msgs_embedding)]
         if features:
             for feature in features:
                 feature_name = feature['name']
@@ -202,44 +154,42 @@ async def get_cities(request: CityRequest):
                 for keyword in keywords:
                     params.extend([f'%{keyword}%', f'%{keyword}%'])
         
-        async with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                # Execute the query
-                cur.execute(base_query, params)
-                cities = cur.fetchall()
+        async with db_manager.get_connection(readonly=True) as conn:
+            # Execute the query
+            cities = await db_manager.fetch_all(conn, "city_search", base_query, params)
 
-                if not cities:
-                    return {"top_cities": []}
-                
-                # For each city, find which features matched
-                cities_list = []
-                for city in cities:
-                    city_name = city[0]
-                    city_desc = city[1]
-                    matched_features = []
-                    
-                    # Check which features match this city
-                    for feature in features:
-                        feature_name = feature['name']
-                        keywords = FEATURES[feature_name]['keywords']
-                        matched_keywords = [k for k in keywords if k.lower() in city_desc.lower() or k.lower() in city_name.lower()]
-                        if matched_keywords:
-                            matched_features.append({
-                                'name': feature_name,
-                                'weight': feature['weight'],
-                                'matched_keywords': matched_keywords
-                            })
-                    
-                    cities_list.append({
-                        "name": city_name,
-                        "description": city_desc,
-                        "longitude": city[2],
-                        "latitude": city[3],
-                        "matched_features": matched_features,
-                        "match_score": float(city[4])  # combined_score from the query
+        if not cities:
+            return {"top_cities": []}
+        
+        # For each city, find which features matched
+        cities_list = []
+        for city in cities:
+            city_name = city[0]
+            city_desc = city[1]
+            matched_features = []
+            
+            # Check which features match this city
+            for feature in features:
+                feature_name = feature['name']
+                keywords = FEATURES[feature_name]['keywords']
+                matched_keywords = [k for k in keywords if k.lower() in city_desc.lower() or k.lower() in city_name.lower()]
+                if matched_keywords:
+                    matched_features.append({
+                        'name': feature_name,
+                        'weight': feature['weight'],
+                        'matched_keywords': matched_keywords
                     })
-                
-                return {"top_cities": cities_list}
+            
+            cities_list.append({
+                "name": city_name,
+                "description": city_desc,
+                "longitude": city[2],
+                "latitude": city[3],
+                "matched_features": matched_features,
+                "match_score": float(city[4])  # combined_score from the query
+            })
+        
+        return {"top_cities": cities_list}
 
     except HTTPException:
         raise
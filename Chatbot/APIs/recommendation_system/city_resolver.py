@@ -0,0 +1,94 @@
+from rapidfuzz import fuzz, process
+from config_helper import get_city_resolver_config
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import time
+from .db_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class CityResolver:
+    """
+    Map the city a user typed to ``states.state_id`` values.
+
+    The states table is small, so it is cached in memory and reloaded every
+    ``refresh_seconds``. A name resolves, in order, through the configured aliases, an
+    exact match, every state whose name contains it (what the old
+    ``lower(S.name) LIKE '%city%'`` filter matched) and finally the closest fuzzy match
+    scoring at least ``min_score``. Routers resolve once per request and filter on
+    ``state_id = ANY(%s)``, which the state_id btree indexes can serve.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.aliases = {alias.lower(): name for alias, name in (config.get('aliases') or {}).items()}
+        self.min_score = config.get('min_score', 85)
+        self.refresh_seconds = config.get('refresh_seconds', 600)
+        self._states: Dict[str, int] = {}
+        self._resolved: Dict[str, List[int]] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.lookups = 0
+        self.cache_hits = 0
+        self.fuzzy_matches = 0
+        self.unresolved = 0
+
+    async def _load_states(self):
+        async with self._lock:
+            if self._states and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            async with db_manager.get_connection(readonly=True) as conn:
+                rows = await db_manager.fetch_all(conn, "state_names", "SELECT state_id, name FROM states")
+            self._states = {name.lower(): state_id for state_id, name in rows if name}
+            self._resolved = {}
+            self._loaded_at = time.monotonic()
+            logger.info(f"Loaded {len(self._states)} states for city resolution")
+
+    def _match(self, city: str) -> List[int]:
+        city = self.aliases.get(city, city).lower()
+        if city in self._states:
+            return [self._states[city]]
+        contained = [state_id for name, state_id in self._states.items() if city in name]
+        if contained:
+            return contained
+        match = process.extractOne(city, list(self._states), scorer=fuzz.WRatio, score_cutoff=self.min_score)
+        if match is not None:
+            self.fuzzy_matches += 1
+            logger.info(f"Resolved city '{city}' to '{match[0]}' (score {match[1]:.0f})")
+            return [self._states[match[0]]]
+        return []
+
+    async def resolve(self, city_name: Optional[str]) -> List[int]:
+        """state_ids for ``city_name``; empty when nothing matches."""
+        self.lookups += 1
+        city = " ".join((city_name or "").lower().split())
+        if not city:
+            return []
+        if not self._states or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            await self._load_states()
+        if city in self._resolved:
+            self.cache_hits += 1
+            return self._resolved[city]
+        state_ids = self._match(city)
+        if not state_ids:
+            self.unresolved += 1
+            logger.warning(f"Could not resolve city '{city_name}' to a state")
+        if len(self._resolved) >= 1024:
+            # Bound the cache against arbitrary user input
+            self._resolved.clear()
+        self._resolved[city] = state_ids
+        return state_ids
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "states": len(self._states),
+            "cached_names": len(self._resolved),
+            "lookups": self.lookups,
+            "cache_hits": self.cache_hits,
+            "fuzzy_matches": self.fuzzy_matches,
+            "unresolved": self.unresolved,
+        }
+
+
+city_resolver = CityResolver(get_city_resolver_config())
@@ -18,6 +18,10 @@ from .activities_api import router as activities_router
 from .plans_api import router as plans_router
 from .landmarks_api import router as landmarks_router
 from .trips_api import router as trips_router
+from .db_manager import db_manager
+from .embedding_client import embedding_client
+from .city_resolver import city_resolver
+from .catalog_index import catalog_indexes
 
 app = FastAPI(title="Egypt Smart Journey Planner API")
 
@@ -30,6 +34,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    await embedding_client.start()
+    try:
+        await db_manager.open_pool()
+    except Exception as e:
+        # Requests retry the checkout, so the API can still come up while the database is away
+        logger.error(f"Database pool not ready at startup: {str(e)}")
+    # Loads in the background; searches fall back to SQL until the in-memory indexes are ready
+    await catalog_indexes.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await embedding_client.close()
+    await catalog_indexes.close()
+    await db_manager.close_pool()
+
 # Add request timing middleware
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
@@ -48,6 +69,16 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "An unexpected error occurred. Please try again later."}
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Connection pool, per-query and embedding client metrics."""
+    return {
+        "database": db_manager.stats(),
+        "embedding_client": embedding_client.stats(),
+        "city_resolver": city_resolver.stats(),
+        "catalog_index": catalog_indexes.stats(),
+    }
+
 # Include all routers with their prefixes
 app.include_router(cities_router, prefix="/api/cities", tags=["Cities"])
 app.include_router(hotels_router, prefix="/api/hotels", tags=["Hotels"])
@@ -1,19 +1,143 @@
-from config_helper import get_db_params
-import psycopg2
-from psycopg2 import pool
+from config_helper import get_db_pool_config, get_db_replica_params, get_vector_index_config
+from db_pool import IdleValidator, LeakDetector, connection_kwargs, pool_options
+import psycopg
+from psycopg import pq
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 import logging
 from contextlib import asynccontextmanager
-from fastapi import HTTPException
+from contextvars import ContextVar
+from fastapi import HTTPException, Request
 import asyncio
+import itertools
 import time
+from typing import Any, Dict, List, Optional, Sequence
+from APIs.metrics import Histogram
 
 logger = logging.getLogger(__name__)
 
+# Endpoint whose request is being served, used to pick the statement timeout
+_current_endpoint: ContextVar[Optional[str]] = ContextVar("db_endpoint", default=None)
+
+class QueryStats:
+    """Execution time and row counts for one named query."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.latency_ms = Histogram()
+
+    def record(self, elapsed_ms: float, rows: int):
+        self.calls += 1
+        self.rows += rows
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.latency_ms.observe(int(elapsed_ms))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "mean_rows": round(self.rows / self.calls, 2) if self.calls else 0.0,
+            "mean_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+
+class Replica:
+    """A read replica's pool and whether reads should currently be sent to it."""
+
+    def __init__(self, name: str, pool: AsyncConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.checkouts = 0
+        self.failures = 0
+        self._connects_seen = 0
+        self._errors_seen = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def _connect_counts(self):
+        """Successful and failed connection attempts the pool has made so far."""
+        stats = self.pool.get_stats()
+        errors = stats.get('connections_errors', 0)
+        return stats.get('connections_num', 0) - errors, errors
+
+    def mark_up(self):
+        self._connects_seen, self._errors_seen = self._connect_counts()
+
+    def connect_failing(self) -> bool:
+        """
+        Whether the pool has failed to connect since it last connected or served a checkout.
+
+        psycopg_pool keeps retrying an unreachable server in the background, counting
+        those attempts in ``pool_size`` but never handing out a connection, so the
+        counters are the only sign that a replica is gone rather than busy.
+        """
+        connects, errors = self._connect_counts()
+        if connects != self._connects_seen:
+            self._connects_seen, self._errors_seen = connects, errors
+            return False
+        return errors > self._errors_seen
+
+    def mark_down(self, retry_seconds: float, reason: str):
+        if self.healthy:
+            logger.warning(f"Replica {self.name} unavailable, reading from other servers for {retry_seconds}s: {reason}")
+        self.failures += 1
+        self.down_until = time.monotonic() + retry_seconds
+
+
 class DatabaseManager:
+    """
+    Process-wide async PostgreSQL pool (psycopg 3).
+
+    Connections are checked out with ``async with db_manager.get_connection() as conn``
+    and queried with ``async with conn.cursor() as cur: await cur.execute(...)``, so a
+    slow query never blocks the event loop. Like the psycopg2 pool it replaces, anything
+    left uncommitted is rolled back when the connection goes back to the pool.
+
+    Checkouts only probe connections that have been idle longer than
+    ``validate_after_idle_seconds``; a background task runs ``pool.check()`` to recycle
+    broken or expired idle connections, and a connection that fails mid-query is closed
+    so the pool replaces just that one.
+
+    With ``database_replicas`` configured, ``get_connection(readonly=True)`` round-robins
+    over the replica pools, skipping any that failed recently, and falls back to the
+    primary when none is available. A query that fails on a replica connection is
+    re-run on a primary connection for the rest of that checkout.
+
+    Every checkout runs with ``statement_timeout_ms`` and the ``vector_index.search``
+    defaults, set transaction-locally at the start of the checkout: behind a
+    transaction-mode pooler (the Neon ``-pooler`` host) session settings would stay on
+    the server connection and leak to other clients. Routers that depend on
+    ``query_scope(endpoint)`` get their endpoint's values from ``statement_timeouts_ms``
+    and ``vector_index.search`` and have their in-flight queries cancelled when the
+    client disconnects.
+    """
     _instance = None
     _pool = None
-    _last_connection_attempt = 0
-    _connection_timeout = 30  # seconds
+    _leak_detector = None
+    _idle_validator = None
+    _health_check_task = None
+    _checkout_wait_ms = None
+    _checkout_failures = 0
+    _timeouts = 0
+    _disconnects = 0
+    _primary_fallbacks = 0
+    _replicas: List[Replica] = []
+    # Replica connections handed out by get_connection, and the primary connection that
+    # took over from one that failed mid-query, keyed by id() of the replica connection
+    _replica_leases: Dict[int, Replica] = {}
+    _fallback_conns: Dict[int, psycopg.AsyncConnection] = {}
+    _query_stats: Dict[str, QueryStats] = {}
+    _statements: Dict[str, str] = {}
     _max_retries = 3
     _retry_delay = 1  # seconds
 
@@ -27,101 +151,377 @@ class DatabaseManager:
             self._initialize_pool()
 
     def _initialize_pool(self):
-        """Initialize the connection pool with optimized settings."""
+        """Create the pool; it is opened on the event loop by open_pool()."""
+        pool_config = get_db_pool_config()
+        self._connection_timeout = pool_config.get('timeout_seconds', 30)
+        self._health_check_interval = pool_config.get('health_check_interval_seconds', 60)
+        self._leak_detector = LeakDetector(pool_config.get('leak_threshold_seconds', 30), name="api-pool")
+        self._idle_validator = IdleValidator(pool_config.get('validate_after_idle_seconds', 30))
+        self._slow_query_ms = pool_config.get('slow_query_ms', 500)
+        self._prepare_statements = pool_config.get('prepared_statements', True)
+        self._statement_timeout_ms = pool_config.get('statement_timeout_ms', 0) or 0
+        self._endpoint_timeouts_ms = pool_config.get('statement_timeouts_ms') or {}
+        self._search_settings = get_vector_index_config().get('search') or {}
+        self._disconnect_poll_seconds = pool_config.get('disconnect_poll_seconds', 0.5)
+        self._replica_checkout_timeout = pool_config.get('replica_checkout_timeout_seconds', 2)
+        self._replica_retry_seconds = pool_config.get('replica_retry_seconds', 30)
+        self._checkout_wait_ms = Histogram()
+
+        self._pool = self._create_pool(connection_kwargs(), pool_config)
+        self._replicas = [
+            Replica(f"{params.get('host')}:{params.get('port', 5432)}", self._create_pool(connection_kwargs(params), pool_config))
+            for params in get_db_replica_params()
+        ]
+        self._replica_cursor = itertools.count()
+
+    def _create_pool(self, kwargs: Dict[str, Any], pool_config: Dict[str, Any]) -> AsyncConnectionPool:
+        return AsyncConnectionPool(
+            kwargs=kwargs,
+            check=self._idle_validator.check_async,
+            configure=self._configure_connection,
+            open=False,
+            **pool_options(pool_config)
+        )
+
+    async def _configure_connection(self, conn: psycopg.AsyncConnection):
+        await self._idle_validator.configure_async(conn)
+        if not self._prepare_statements:
+            # Also stop psycopg preparing repeated queries on its own, for poolers that cannot track them
+            conn.prepare_threshold = None
+
+    @staticmethod
+    async def _apply_settings(conn: psycopg.AsyncConnection, settings: Dict[str, str], local: bool):
+        """Set several session parameters in one round trip; ``local`` ones end with the transaction."""
+        calls = ", ".join(["set_config(%s, %s, %s)"] * len(settings))
+        params = [value for name, setting in settings.items() for value in (name, setting, local)]
+        await conn.execute(f"SELECT {calls}", params)
+
+    def register_statement(self, name: str, query: str) -> str:
+        """
+        Register a hot query under a name so fetch_all prepares it server-side.
+
+        psycopg prepares the statement the first time it runs on each connection and
+        executes it by its prepared name afterwards, skipping parse and plan.
+        """
+        self._statements[name] = query
+        return query
+
+    def query_scope(self, endpoint: str):
+        """
+        Router dependency that applies ``endpoint``'s statement timeout and watches for disconnects.
+
+        If the client goes away mid-request the handler task is cancelled; psycopg then
+        sends a cancel request for the running query, so abandoned vector scans stop and
+        their connections go back to the pool.
+        """
+        async def scope(request: Request):
+            token = _current_endpoint.set(endpoint)
+            task = asyncio.current_task()
+            disconnected = asyncio.Event()
+
+            async def watch():
+                while not await request.is_disconnected():
+                    await asyncio.sleep(self._disconnect_poll_seconds)
+                disconnected.set()
+                task.cancel()
+
+            watcher = asyncio.create_task(watch())
+            try:
+                yield
+            except asyncio.CancelledError:
+                if not disconnected.is_set():
+                    raise
+                if hasattr(task, "uncancel"):  # Python 3.11+
+                    task.uncancel()
+                DatabaseManager._disconnects += 1
+                logger.info(f"Client disconnected, cancelled {endpoint} request")
+                raise HTTPException(status_code=499, detail="Client closed request")
+            finally:
+                watcher.cancel()
+                _current_endpoint.reset(token)
+
+        return scope
+
+    def statement_timeout_ms(self, endpoint: Optional[str] = None) -> int:
+        return self._endpoint_timeouts_ms.get(endpoint, self._statement_timeout_ms) if endpoint else self._statement_timeout_ms
+
+    def session_settings(self, endpoint: Optional[str] = None) -> Dict[str, str]:
+        """Statement timeout and vector index search parameters for ``endpoint`` (or the defaults)."""
+        settings = {}
+        timeout_ms = self.statement_timeout_ms(endpoint)
+        if timeout_ms or self._statement_timeout_ms:
+            settings['statement_timeout'] = str(timeout_ms)
+        search = dict(self._search_settings.get('default') or {})
+        if endpoint:
+            search.update(self._search_settings.get(endpoint) or {})
+        settings.update({name: str(value) for name, value in search.items() if value is not None})
+        return settings
+
+    async def open_pool(self):
+        """Open the pool and wait for the minimum number of connections."""
+        if self._pool is None:
+            self._initialize_pool()
+        for replica in self._replicas:
+            # Replicas connect in the background; one that cannot is taken out of rotation on checkout
+            await replica.pool.open(wait=False)
         try:
-            DB_Prams = get_db_params()
-            DB_Prams.update({
-                'sslmode': 'require',
-                'connect_timeout': 10,
-                'keepalives': 1,
-                'keepalives_idle': 30,
-                'keepalives_interval': 10,
-                'keepalives_count': 5
-            })
-            
-            self._pool = pool.ThreadedConnectionPool(
-                minconn=1,  # Start with fewer connections
-                maxconn=10,  # Limit max connections
-                **DB_Prams
-            )
+            await self._pool.open(wait=True, timeout=self._connection_timeout)
             logger.info("Database connection pool initialized successfully")
         except Exception as e:
             logger.error(f"Failed to create connection pool: {str(e)}")
-            self._pool = None
             raise
+        finally:
+            if self._health_check_interval and self._health_check_task is None:
+                self._health_check_task = asyncio.create_task(self._health_check_loop())
 
-    def _validate_connection(self, conn):
-        """Validate if a connection is still active."""
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-                return True
-        except Exception:
-            return False
+    async def _health_check_loop(self):
+        """Periodically verify idle connections off the request path."""
+        while True:
+            await asyncio.sleep(self._health_check_interval)
+            try:
+                started = time.monotonic()
+                await self._pool.check()
+                for replica in self._replicas:
+                    # Also checks replicas that are out of rotation, which makes their pools
+                    # reconnect, so connect_failing() notices when they come back
+                    await replica.pool.check()
+                self._idle_validator.mark_health_checked(started)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Connection pool health check failed: {str(e)}")
 
-    def _get_connection_with_retry(self):
+    async def _get_connection_with_retry(self) -> psycopg.AsyncConnection:
         """Get a connection from the pool with retry logic."""
-        current_time = time.time()
-        
-        # If we've tried too recently, wait
-        if current_time - self._last_connection_attempt < self._retry_delay:
-            time.sleep(self._retry_delay)
-        
-        self._last_connection_attempt = current_time
-        
+        if self._pool is None or self._pool.closed:
+            await self.open_pool()
+
         for attempt in range(self._max_retries):
+            started = time.perf_counter()
             try:
-                conn = self._pool.getconn()
-                if self._validate_connection(conn):
-                    return conn
-                else:
-                    self._pool.putconn(conn, close=True)
-                    raise psycopg2.OperationalError("Connection validation failed")
-            except Exception as e:
+                conn = await self._pool.getconn()
+                self._checkout_wait_ms.observe(int((time.perf_counter() - started) * 1000))
+                return conn
+            except (psycopg.OperationalError, PoolTimeout) as e:
+                DatabaseManager._checkout_failures += 1
                 logger.error(f"Connection attempt {attempt + 1} failed: {str(e)}")
                 if attempt == self._max_retries - 1:
-                    raise
-                time.sleep(self._retry_delay * (2 ** attempt))
-        
-        raise psycopg2.OperationalError("Failed to get valid connection after retries")
+                    raise psycopg.OperationalError(str(e)) from e
+                await asyncio.sleep(self._retry_delay * (2 ** attempt))
+
+        raise psycopg.OperationalError("Failed to get valid connection after retries")
+
+    async def _get_replica_connection(self):
+        """Check out a connection from the next healthy replica, or return (None, None) if there is none."""
+        if not self._replicas:
+            return None, None
+        start = next(self._replica_cursor)
+        for offset in range(len(self._replicas)):
+            replica = self._replicas[(start + offset) % len(self._replicas)]
+            if not replica.healthy:
+                continue
+            if replica.connect_failing():
+                # Skip it without making this request wait out a checkout timeout
+                replica.mark_down(self._replica_retry_seconds, "connection attempts are failing")
+                continue
+            started = time.perf_counter()
+            try:
+                conn = await replica.pool.getconn(timeout=self._replica_checkout_timeout)
+            except PoolTimeout as e:
+                # A replica that is merely busy stays in rotation; one that cannot connect is down
+                if replica.connect_failing() or replica.pool.get_stats().get('pool_size', 0) == 0:
+                    replica.mark_down(self._replica_retry_seconds, str(e))
+                continue
+            except psycopg.OperationalError as e:
+                replica.mark_down(self._replica_retry_seconds, str(e))
+                continue
+            self._checkout_wait_ms.observe(int((time.perf_counter() - started) * 1000))
+            replica.mark_up()
+            replica.checkouts += 1
+            return conn, replica
+        DatabaseManager._primary_fallbacks += 1
+        return None, None
+
+    async def _return_connection(self, conn: psycopg.AsyncConnection, pool: AsyncConnectionPool):
+        self._leak_detector.returned(conn)
+        try:
+            if not conn.closed and conn.info.transaction_status != pq.TransactionStatus.IDLE:
+                await conn.rollback()
+        except Exception as e:
+            logger.error(f"Error rolling back connection: {str(e)}")
+        if not conn.closed:
+            self._idle_validator.mark_used(conn)
+        try:
+            await pool.putconn(conn)
+        except Exception as e:
+            logger.error(f"Error returning connection to pool: {str(e)}")
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    async def _apply_session(self, conn: psycopg.AsyncConnection):
+        settings = self.session_settings(_current_endpoint.get())
+        if settings:
+            # Transaction-local, so they hold for this checkout only and are undone by the rollback on return
+            await self._apply_settings(conn, settings, local=True)
+
+    async def _replica_failed(self, conn: psycopg.AsyncConnection, replica: Replica, reason: str):
+        replica.mark_down(self._replica_retry_seconds, reason)
+        if not conn.closed:
+            # Evict it; the replica pool replaces it once the server is reachable again
+            await conn.close()
 
     @asynccontextmanager
-    async def get_connection(self):
-        """Get a database connection from the pool with retry logic."""
-        conn = None
+    async def get_connection(self, readonly: bool = False):
+        """
+        Get a database connection from the pool with retry logic.
+
+        Read-only callers are served from a replica when one is configured and healthy.
+        """
+        conn = replica = None
         try:
-            conn = self._get_connection_with_retry()
+            if readonly:
+                conn, replica = await self._get_replica_connection()
+                if conn is not None:
+                    try:
+                        await self._apply_session(conn)
+                    except psycopg.OperationalError as e:
+                        await self._replica_failed(conn, replica, str(e))
+                        await self._return_connection(conn, replica.pool)
+                        conn = replica = None
+            if conn is None:
+                conn = await self._get_connection_with_retry()
+                await self._apply_session(conn)
+            else:
+                self._replica_leases[id(conn)] = replica
+            self._leak_detector.checked_out(conn)
             yield conn
-        except psycopg2.OperationalError as e:
+        except HTTPException:
+            raise
+        except psycopg.errors.QueryCanceled as e:
+            DatabaseManager._timeouts += 1
+            logger.error(f"Query cancelled after statement timeout: {str(e)}")
+            raise HTTPException(status_code=504, detail="Database query timed out")
+        except psycopg.OperationalError as e:
             logger.error(f"Database connection error: {str(e)}")
-            # Try to reinitialize the pool if we get connection errors
-            if self._pool:
-                try:
-                    self._pool.closeall()
-                except:
-                    pass
-                self._pool = None
-                self._initialize_pool()
+            if replica is not None:
+                replica.mark_down(self._replica_retry_seconds, str(e))
+            if conn is not None and not conn.closed:
+                # Evict just this connection; the pool opens a replacement in the background
+                await conn.close()
             raise HTTPException(status_code=503, detail="Database connection failed after multiple attempts")
         except Exception as e:
             logger.error(f"Unexpected database error: {str(e)}")
             raise HTTPException(status_code=500, detail="Internal server error")
         finally:
-            if conn:
-                try:
-                    self._pool.putconn(conn)
-                except Exception as e:
-                    logger.error(f"Error returning connection to pool: {str(e)}")
-                    try:
-                        conn.close()
-                    except:
-                        pass
+            if conn is not None:
+                self._replica_leases.pop(id(conn), None)
+                fallback = self._fallback_conns.pop(id(conn), None)
+                if fallback is not None:
+                    await self._return_connection(fallback, self._pool)
+                await self._return_connection(conn, replica.pool if replica is not None else self._pool)
+
+    def _record_query(self, name: str, elapsed_ms: float, rows: int):
+        stats = self._query_stats.setdefault(name, QueryStats())
+        stats.record(elapsed_ms, rows)
+        if self._slow_query_ms and elapsed_ms > self._slow_query_ms:
+            logger.warning(f"Slow query {name}: {elapsed_ms:.0f}ms, {rows} rows")
 
-    def close_pool(self):
+    async def fetch_all(self, conn: psycopg.AsyncConnection, name: str, query: str,
+                        params: Optional[Sequence[Any]] = None, row_factory=None) -> List[Any]:
+        """
+        Run a named query on ``conn`` and record its execution time and row count.
+
+        If ``conn`` is a replica connection that fails, the replica is taken out of
+        rotation and the query (and any later one on ``conn``) runs on the primary.
+        """
+        prepare = True if self._prepare_statements and self._statements.get(name) == query else None
+        target = self._fallback_conns.get(id(conn), conn)
+        started = time.perf_counter()
+        try:
+            try:
+                rows = await self._execute(target, query, params, prepare, row_factory)
+            except psycopg.errors.QueryCanceled:
+                raise
+            except psycopg.OperationalError as e:
+                replica = self._replica_leases.get(id(conn))
+                if replica is None or target is not conn:
+                    raise
+                logger.warning(f"Replica {replica.name} failed running {name}, retrying on the primary: {str(e)}")
+                await self._replica_failed(conn, replica, str(e))
+                target = await self._get_connection_with_retry()
+                self._fallback_conns[id(conn)] = target
+                self._leak_detector.checked_out(target)
+                DatabaseManager._primary_fallbacks += 1
+                await self._apply_session(target)
+                rows = await self._execute(target, query, params, prepare, row_factory)
+        except Exception:
+            self._query_stats.setdefault(name, QueryStats()).errors += 1
+            raise
+        self._record_query(name, (time.perf_counter() - started) * 1000, len(rows))
+        return rows
+
+    @staticmethod
+    async def _execute(conn: psycopg.AsyncConnection, query: str, params: Optional[Sequence[Any]],
+                       prepare: Optional[bool], row_factory) -> List[Any]:
+        async with conn.cursor(row_factory=row_factory) as cur:
+            await cur.execute(query, params, prepare=prepare)
+            return await cur.fetchall()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy, checkout latency and per-query timings for the /metrics endpoint."""
+        pool_stats = self._pool.get_stats() if self._pool is not None else {}
+        return {
+            "pool": {
+                "size": pool_stats.get('pool_size', 0),
+                "in_use": self._leak_detector.in_use if self._leak_detector else 0,
+                "idle": pool_stats.get('pool_available', 0),
+                "waiting": pool_stats.get('requests_waiting', 0),
+                "min_size": pool_stats.get('pool_min'),
+                "max_size": pool_stats.get('pool_max'),
+                "connections_lost": pool_stats.get('connections_lost', 0),
+            },
+            "checkout": {
+                "wait_ms": self._checkout_wait_ms.snapshot() if self._checkout_wait_ms else {},
+                "failures": self._checkout_failures,
+                "held_past_leak_threshold": self._leak_detector.leaks_reported if self._leak_detector else 0,
+            },
+            "cancellation": {
+                "statement_timeouts": self._timeouts,
+                "client_disconnects": self._disconnects,
+            },
+            "replicas": [
+                {
+                    "name": replica.name,
+                    "healthy": replica.healthy,
+                    "size": replica.pool.get_stats().get('pool_size', 0),
+                    "idle": replica.pool.get_stats().get('pool_available', 0),
+                    "checkouts": replica.checkouts,
+                    "failures": replica.failures,
+                }
+                for replica in self._replicas
+            ],
+            "reads_on_primary_fallback": self._primary_fallbacks if self._replicas else 0,
+            "validation": self._idle_validator.stats() if self._idle_validator else {},
+            "prepared_statements": sorted(self._statements) if self._prepare_statements else [],
+            "queries": {name: stats.snapshot() for name, stats in sorted(self._query_stats.items())},
+        }
+
+    async def close_pool(self):
         """Close all connections in the pool."""
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            self._health_check_task = None
+        for replica in self._replicas:
+            try:
+                await replica.pool.close()
+            except Exception as e:
+                logger.error(f"Error closing replica pool {replica.name}: {str(e)}")
+        self._replicas = []
         if self._pool:
             try:
-                self._pool.closeall()
+                await self._pool.close()
                 logger.info("Database connection pool closed successfully")
             except Exception as e:
                 logger.error(f"Error closing connection pool: {str(e)}")
@@ -129,4 +529,4 @@ class DatabaseManager:
                 self._pool = None
 
 # Create a singleton instance
-db_manager = DatabaseManager() 
\ No newline at end of file
+db_manager = DatabaseManager()
@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import random
+import time
+import aiohttp
+import numpy as np
+from config_helper import get_api_urls, get_embedding_config
+from APIs.metrics import Histogram
+from APIs.embedding_system.wire import FLOAT32_MEDIA_TYPE, decode_embedding_response
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: the service is warming up, restarting or overloaded
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class EmbeddingClient:
+    """
+    Shared client for the embedding service used by every recommender.
+
+    In ``http`` mode one long-lived ``aiohttp`` session keeps a keep-alive connection
+    pool to the embedding API, so requests skip TCP setup, and failed calls are retried
+    with jittered exponential backoff. In ``inprocess`` mode the client owns an
+    ``EmbeddingService`` and calls it on a thread executor, skipping the network hop
+    and wire encoding entirely. Every call's latency is recorded for ``stats()``.
+    """
+
+    def __init__(self, embedding_config: Optional[Dict[str, Any]] = None):
+        embedding_config = embedding_config or {}
+        config = embedding_config.get('client', {})
+        self.mode = config.get('mode', 'http')
+        if self.mode not in ("http", "inprocess"):
+            raise ValueError(f"Unknown embedding client mode {self.mode!r}, expected 'http' or 'inprocess'")
+        api_urls = get_api_urls()
+        self.text_url = api_urls.get('embedding')
+        self.batch_url = api_urls.get('embedding_batch')
+        self.timeout = aiohttp.ClientTimeout(
+            total=config.get('timeout_seconds', 10),
+            connect=config.get('connect_timeout_seconds', 2)
+        )
+        self.max_connections = config.get('max_connections', 32)
+        self.keepalive_seconds = config.get('keepalive_seconds', 30)
+        self.retries = config.get('retries', 2)
+        self.backoff = config.get('backoff_ms', 100) / 1000
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self.embedding_config = embedding_config
+        self.inprocess_threads = config.get('inprocess_threads', 4)
+        self._service = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.latency_ms = Histogram()
+
+    async def start(self):
+        if self.mode == "inprocess":
+            self._start_service()
+            return
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=self.keepalive_seconds
+                )
+                self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+                logger.info(f"Embedding client started (max_connections={self.max_connections})")
+
+    def _start_service(self):
+        if self._service is not None:
+            return
+        from APIs.embedding_system.service import EmbeddingService
+
+        self._executor = ThreadPoolExecutor(max_workers=self.inprocess_threads, thread_name_prefix="embedding-client")
+        self._service = EmbeddingService(self.embedding_config)
+        self._service.start(background=True)
+        logger.info(f"Embedding client running the model in-process ({self.inprocess_threads} threads)")
+
+    async def close(self):
+        if self._service is not None:
+            self._service.stop()
+            self._executor.shutdown(wait=False)
+            self._service = None
+            self._executor = None
+        async with self._session_lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+    async def _post(self, url: str, payload: Dict[str, Any]) -> Optional[np.ndarray]:
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        start_time = time.perf_counter()
+        self.calls += 1
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+                try:
+                    async with self._session.post(url, json=payload, headers={"Accept": FLOAT32_MEDIA_TYPE}) as response:
+                        if response.status == 200:
+                            return decode_embedding_response(await response.read(), response.headers)
+                        if response.status not in RETRYABLE_STATUSES:
+                            logger.error(f"Error getting embedding: {response.status}")
+                            break
+                        logger.warning(f"Embedding service returned {response.status} (attempt {attempt + 1})")
+                except (ValueError, IndexError) as e:
+                    logger.error(f"Invalid embedding response: {str(e)}")
+                    break
+                except asyncio.TimeoutError:
+                    logger.warning(f"Embedding API request timed out (attempt {attempt + 1})")
+                except aiohttp.ClientError as e:
+                    logger.warning(f"Error calling embedding API: {str(e)} (attempt {attempt + 1})")
+            self.failures += 1
+            return None
+        finally:
+            self.latency_ms.observe(int((time.perf_counter() - start_time) * 1000))
+
+    async def _encode_local(self, texts: List[str]) -> Optional[np.ndarray]:
+        if self._service is None:
+            self._start_service()
+
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        self.calls += 1
+        try:
+            if self._service.state == "failed":
+                # The model will not load; fail at once instead of waiting out the timeout
+                self.failures += 1
+                return None
+            if not self._service.ready:
+                # Requests arriving during warm-up wait for the model rather than failing
+                ready = await loop.run_in_executor(self._executor, self._service.wait_until_ready, self.timeout.total)
+                if not ready:
+                    logger.warning(f"In-process embedding service is {self._service.state}")
+                    self.failures += 1
+                    return None
+            return np.stack(await loop.run_in_executor(self._executor, self._service.embed_texts, texts))
+        except Exception as e:
+            logger.error(f"Error embedding in-process: {str(e)}")
+            self.failures += 1
+            return None
+        finally:
+            self.latency_ms.observe(int((time.perf_counter() - start_time) * 1000))
+
+    async def _encode(self, texts: List[str], url: str, payload: Dict[str, Any]) -> Optional[np.ndarray]:
+        if self.mode == "inprocess":
+            return await self._encode_local(texts)
+        return await self._post(url, payload)
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed one text, returning None when the text is empty or the service fails."""
+        if not text or not text.strip():
+            logger.warning("Empty text provided for embedding")
+            return None
+        embeddings = await self._encode([text], self.text_url, {"text": text})
+        return embeddings[0] if embeddings is not None and len(embeddings) else None
+
+    async def embed_batch(self, texts: List[str]) -> Optional[List[np.ndarray]]:
+        """Embed several texts in one request, preserving input order."""
+        if not texts:
+            return []
+        embeddings = await self._encode(texts, self.batch_url, {"texts": texts})
+        return list(embeddings) if embeddings is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retried,
+            "latency_ms": self.latency_ms.snapshot(),
+            **({"service": self._service.stats()} if self._service is not None else {}),
+        }
+
+
+embedding_client = EmbeddingClient(get_embedding_config())
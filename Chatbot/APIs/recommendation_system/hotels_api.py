@@ -1,15 +1,37 @@
 from rapidfuzz import fuzz
-from config_helper import get_db_params
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Dict
 import logging
-import psycopg2
+import psycopg
 from .db_manager import db_manager
+from .city_resolver import city_resolver
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(db_manager.query_scope("hotels"))])
 logger = logging.getLogger(__name__)
 
+HOTEL_QUERY = db_manager.register_statement("hotel_search", """
+    SELECT h.hotel_id,
+           h.name,
+           MIN(r.total_price)             as price_per_night,
+           h.longitude,
+           h.latitude,
+           array_agg(DISTINCT hf.name)    as facilities,
+           COUNT(DISTINCT hf.facility_id) as matching_facilities,
+           h.img
+    FROM hotels h
+             JOIN hotels_facilities_rel hfr ON h.hotel_id = hfr.hotel_id
+             JOIN hotel_facilities hf ON hfr.facility_id = hf.facility_id
+             JOIN rooms r ON h.hotel_id = r.hotel_id
+    WHERE h.state_id = ANY (%s)
+      AND hf.facility_id = ANY (%s)
+      AND r.total_price <= %s
+    GROUP BY h.hotel_id, h.name, h.longitude, h.latitude, h.img
+    HAVING COUNT(DISTINCT hf.facility_id) > 0
+    ORDER BY matching_facilities DESC, price_per_night ASC
+    LIMIT 15
+""")
+
 class HotelRequest(BaseModel):
     city_name: str
     duration: int
@@ -29,28 +51,29 @@ class HotelResponse(BaseModel):
 async def get_facilities_ids(conn, user_facilities: List[str]) -> Dict[str, int]:
     """Get facility IDs based on user preferences."""
     try:
-        with conn.cursor() as cur:
-            # Get all facilities in one query
-            cur.execute("""
-                        SELECT facility_id, name
-                        FROM hotel_facilities
-                        WHERE name IS NOT NULL
-                        """)
-            facilities = cur.fetchall()
-
-            if not facilities:
-                logger.error("No facilities found in database")
-                raise HTTPException(status_code=500, detail="No facilities available")
-
-            facilities_dic = {}
-            for user_facility in user_facilities:
-                for f_id, name in facilities:
-                    if fuzz.ratio(user_facility.lower(), name.lower()) >= 60:
-                        facilities_dic[user_facility] = f_id
-                        break
-
-            return facilities_dic
-    except psycopg2.Error as e:
+        # Get all facilities in one query
+        facilities = await db_manager.fetch_all(conn, "hotel_facilities", """
+                    SELECT facility_id, name
+                    FROM hotel_facilities
+                    WHERE name IS NOT NULL
+                    """)
+
+        if not facilities:
+            logger.error("No facilities found in database")
+            raise HTTPException(status_code=500, detail="No facilities available")
+
+        facilities_dic = {}
+        for user_facility in user_facilities:
+            for f_id, name in facilities:
+                if fuzz.ratio(user_facility.lower(), name.lower()) >= 60:
+                    facilities_dic[user_facility] = f_id
+                    break
+
+        return facilities_dic
+    except psycopg.errors.QueryCanceled:
+        # Statement timeout; get_connection turns it into a 504
+        raise
+    except psycopg.Error as e:
         logger.error(f"Database error in get_facilities_ids: {str(e)}")
         raise HTTPException(status_code=500, detail="Error accessing facilities")
     except Exception as e:
@@ -60,22 +83,23 @@ async def get_facilities_ids(conn, user_facilities: List[str]) -> Dict[str, int]
 async def get_facilities(conn, hotel_id: int) -> List[str]:
     """Get all hotel facilities from the database."""
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                        SELECT hf.facility_id, hf.name
-                        FROM hotel_facilities hf
-                                 JOIN hotels_facilities_rel hfr ON hf.facility_id = hfr.facility_id
-                        WHERE hfr.hotel_id = %s
-                        """, (hotel_id,))
-            facilities = cur.fetchall()
-
-            if not facilities:
-                logger.error(f"No facilities found for hotel ID {hotel_id}")
-                return []
-
-            facilities_list = [facility[1] for facility in facilities if facility[1] is not None]
-            return facilities_list
-    except psycopg2.Error as e:
+        facilities = await db_manager.fetch_all(conn, "hotel_facilities_by_hotel", """
+                    SELECT hf.facility_id, hf.name
+                    FROM hotel_facilities hf
+                             JOIN hotels_facilities_rel hfr ON hf.facility_id = hfr.facility_id
+                    WHERE hfr.hotel_id = %s
+                    """, (hotel_id,))
+
+        if not facilities:
+            logger.error(f"No facilities found for hotel ID {hotel_id}")
+            return []
+
+        facilities_list = [facility[1] for facility in facilities if facility[1] is not None]
+        return facilities_list
+    except psycopg.errors.QueryCanceled:
+        # Statement timeout; get_connection turns it into a 504
+        raise
+    except psycopg.Error as e:
         logger.error(f"Database error in get_facilities: {str(e)}")
         raise HTTPException(status_code=500, detail="Error accessing hotel facilities")
     except Exception as e:
@@ -105,7 +129,14 @@ async def get_hotels(request: HotelRequest):
     try:
         logger.info(f"Searching hotels in {request.city_name} with facilities: {request.facilities}")
 
-        async with db_manager.get_connection() as conn:
+        state_ids = await city_resolver.resolve(request.city_name)
+        if not state_ids:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No hotels found in {request.city_name}"
+            )
+
+        async with db_manager.get_connection(readonly=True) as conn:
             # Get facility IDs
             facilities_ids = await get_facilities_ids(conn, request.facilities)
             if not facilities_ids:
@@ -118,36 +149,16 @@ async def get_hotels(request: HotelRequest):
             price_limit = request.budget / request.duration
 
             # Get hotels
-            with conn.cursor() as cur:
-                query = """
-                        SELECT h.hotel_id, \
-                               h.name, \
-                               MIN(r.total_price)             as price_per_night, \
-                               h.longitude, \
-                               h.latitude, \
-                               array_agg(DISTINCT hf.name)    as facilities, \
-                               COUNT(DISTINCT hf.facility_id) as matching_facilities, \
-                               h.img
-                        FROM hotels h
-                                 JOIN hotels_facilities_rel hfr ON h.hotel_id = hfr.hotel_id
-                                 JOIN hotel_facilities hf ON hfr.facility_id = hf.facility_id
-                                 JOIN rooms r ON h.hotel_id = r.hotel_id
-                                 JOIN states s ON h.state_id = s.state_id
-                        WHERE lower(s.name) LIKE %s
-                          AND hf.facility_id = ANY (%s)
-                          AND r.total_price <= %s
-                        GROUP BY h.hotel_id, h.name, h.longitude, h.latitude, h.img
-                        HAVING COUNT(DISTINCT hf.facility_id) > 0
-                        ORDER BY matching_facilities DESC, price_per_night ASC
-                        LIMIT 15; \
-                        """
-                try:
-                    cur.execute(query,
-                                ('%' + request.city_name.lower() + '%', list(facilities_ids.values()), price_limit))
-                    result = cur.fetchall()
-                except psycopg2.Error as e:
-                    logger.error(f"Database error in hotel query: {str(e)}")
-                    raise HTTPException(status_code=500, detail="Error searching for hotels")
+            try:
+                result = await db_manager.fetch_all(
+                    conn, "hotel_search", HOTEL_QUERY,
+                    (state_ids, list(facilities_ids.values()), price_limit)
+                )
+            except psycopg.errors.QueryCanceled:
+                raise
+            except psycopg.Error as e:
+                logger.error(f"Database error in hotel query: {str(e)}")
+                raise HTTPException(status_code=500, detail="Error searching for hotels")
 
             if not result:
                 raise HTTPException(
@@ -1,12 +1,15 @@
-import asyncio
-import aiohttp
-from config_helper import get_api_urls
-from fastapi import APIRouter, HTTPException, Request
+import base64
+import json
+from fastapi import APIRouter, HTTPException, Request, Depends
+from APIs.embedding_system.wire import vector_literal
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import time
 import logging
 from .db_manager import db_manager
+from .embedding_client import embedding_client
+from .city_resolver import city_resolver
+from .catalog_index import CityVectorIndex, catalog_indexes
 
 # Configure logging
 logging.basicConfig(
@@ -15,21 +18,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
-
-EMBEDDING_API_URL = get_api_urls().get('embedding')
-
-LANDMARK_QUERY = """
-    SELECT *, 1 - (L.embedding <=> %s::vector) AS similarity
-    FROM landmarks L join states S on L.state_id = S.state_id
-    WHERE lower(S.name) LIKE %s
-    ORDER BY similarity desc
-   """
+router = APIRouter(dependencies=[Depends(db_manager.query_scope("landmarks"))])
+
+# One page of the city's landmarks for several query vectors in one round trip. Each
+# landmark's best similarity over all vectors, and the 1-based position of that vector, is
+# computed once per (landmark, vector) pair; the score floor, the (score, id) keyset of
+# the previous page and the LIMIT then apply to those rows. Ranking is exact over the
+# city's rows, so filtering never leaves a page short.
+LANDMARK_QUERY = db_manager.register_statement("landmark_search", """
+    WITH best AS (
+        SELECT DISTINCT ON (L.landmark_id)
+               q.preference, L.landmark_id, L.name, L.description,
+               1 - (L.embedding <=> q.query_vector) AS similarity, L.price, L.longitude, L.latitude
+        FROM landmarks L
+        CROSS JOIN unnest(%(vectors)s::vector[]) WITH ORDINALITY AS q(query_vector, preference)
+        WHERE L.state_id = ANY(%(state_ids)s)
+        ORDER BY L.landmark_id, similarity DESC, q.preference
+    )
+    SELECT preference, landmark_id, name, description, similarity, price, longitude, latitude
+    FROM best
+    WHERE similarity >= %(min_score)s
+      AND (similarity < %(after_score)s OR (similarity = %(after_score)s AND landmark_id > %(after_id)s))
+    ORDER BY similarity DESC, landmark_id
+    LIMIT %(page_size)s
+""")
+
+# Same columns as LANDMARK_QUERY's matches without the similarity, for the in-memory per-city index
+LANDMARK_INDEX = catalog_indexes.register(CityVectorIndex("landmarks", """
+    SELECT state_id, landmark_id, name, description, price, longitude, latitude, embedding::real[]
+    FROM landmarks
+"""))
 
 class LandmarksRequestByText(BaseModel):
     city_name: str = Field(..., min_length=1, description="Name of the city")
     user_message: str = Field(..., min_length=1, description="User's message for landmark search")
     preferred_landmarks: List[str] = Field(default_factory=list, description="List of preferred landmarks")
+    limit: int = Field(50, ge=1, le=200, description="Landmarks per page")
+    min_score: Optional[float] = Field(None, ge=-1, le=1, description="Leave out landmarks scoring below this similarity")
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page")
 
 class LandmarkResponse(BaseModel):
     id: int
@@ -40,6 +66,11 @@ class LandmarkResponse(BaseModel):
     longitude: float 
     latitude: float
     img: str or None = None
+    matched_preference: Optional[str] = None
+
+class LandmarksPage(BaseModel):
+    landmarks: List[LandmarkResponse]
+    next_cursor: Optional[str] = None
 
 def convert_row_to_dict(row: tuple) -> Dict[str, Any]:
     """Convert database row to dictionary format."""
@@ -47,124 +78,112 @@ def convert_row_to_dict(row: tuple) -> Dict[str, Any]:
         return {
             "id": row[0],
             "name": row[1],
-            "description": row[5],
-            "score": row[10],
-            "price": row[7],
-            "longitude": row[3],
-            "latitude": row[4],
+            "description": row[2],
+            "score": row[3],
+            "price": row[4],
+            "longitude": row[5],
+            "latitude": row[6],
         }
     except Exception as e:
         logger.error(f"Error converting row to dict: {str(e)}")
         raise
 
-async def get_embedding(text: str) -> List[float]:
-    """Get embedding for text using the embedding API."""
-    start_time = time.time()
-    try:
-        if not text or not text.strip():
-            logger.warning("Empty text provided for embedding")
-            return None
-            
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                EMBEDDING_API_URL,
-                json={"text": text},
-                timeout=10
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if 'embedding' not in result:
-                        logger.error(f"No embedding in response: {result}")
-                        return None
-                    logger.info(f"Embedding generated in {time.time() - start_time:.2f}s")
-                    return result['embedding']
-                else:
-                    logger.error(f"Error getting embedding: {response.status}")
-                    return None
-    except aiohttp.ClientTimeout:
-        logger.error("Embedding API request timed out")
-        return None
-    except aiohttp.ClientError as e:
-        logger.error(f"Error calling embedding API: {str(e)}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error getting embedding: {str(e)}")
-        return None
-
-async def get_landmark_by_text(conn, city_name: str, user_message: str) -> List[Dict[str, Any]]:
-    """Get landmarks based on user message similarity."""
-    try:
-        embedding = await get_embedding(user_message)
-        if not embedding:
-            return []
-            
-        with conn.cursor() as cursor:
-            cursor.execute(LANDMARK_QUERY, (embedding, '%' + city_name.lower() + '%'))
-            result = cursor.fetchall()
-            return [convert_row_to_dict(row) for row in result]
-    except Exception as e:
-        logger.error(f"Error in get_landmark_by_text: {str(e)}")
-        return []
+def encode_cursor(score: float, landmark_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, landmark_id]).encode()).decode()
 
-async def get_landmark_by_user_activities(conn, city_name: str, user_activities: List[str]) -> List[Dict[str, Any]]:
-    """Get landmarks based on user preferred activities."""
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """(score, landmark_id) of the last landmark on the previous page."""
     try:
-        landmarks_list = []
-        with conn.cursor() as cursor:
-            for activity in user_activities:
-                embedding = await get_embedding(activity)
-                if not embedding:
-                    continue
-                    
-                cursor.execute(LANDMARK_QUERY, (embedding, '%' + city_name.lower() + '%'))
-                landmarks_list.extend(convert_row_to_dict(row) for row in cursor.fetchall())
-                
-        # Remove duplicates while preserving order
-        return list({landmark['id']: landmark for landmark in landmarks_list}.values())
-    except Exception as e:
-        logger.error(f"Error in get_landmark_by_user_activities: {str(e)}")
-        return []
-
-@router.post("/recommend", response_model=Dict[str, List[LandmarkResponse]])
+        score, landmark_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(landmark_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def search_landmarks(city_name: str, texts: List[str], limit: int = 50, min_score: Optional[float] = None,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Embed every text in one call, then fetch one page of the city's landmarks ranked against all of them.
+
+    Landmarks are ordered by their best score over the texts, then id, and each is tagged
+    with the text that matched it. Returns the page and the cursor for the next one.
+    """
+    after_score, after_id = decode_cursor(cursor) if cursor else (float('inf'), 0)
+    texts = [text for text in texts if text and text.strip()]
+    if not texts:
+        return [], None
+
+    state_ids = await city_resolver.resolve(city_name)
+    if not state_ids:
+        return [], None
+
+    embeddings = await embedding_client.embed_batch(texts)
+    if embeddings is None:
+        return [], None
+
+    floor = min_score if min_score is not None else -1.0
+    # One extra row tells whether there is a next page
+    page_size = limit + 1
+    matches = LANDMARK_INDEX.search(state_ids, embeddings, None)
+    if matches is not None:
+        best: Dict[int, tuple] = {}
+        for preference, pairs in enumerate(matches, start=1):
+            for item, similarity in pairs:
+                if item[0] not in best or similarity > best[item[0]][4]:
+                    best[item[0]] = (preference, *item[:3], similarity, *item[3:])
+        rows = sorted(
+            (row for row in best.values()
+             if row[4] >= floor and (row[4] < after_score or (row[4] == after_score and row[1] > after_id))),
+            key=lambda row: (-row[4], row[1])
+        )[:page_size]
+    else:
+        async with db_manager.get_connection(readonly=True) as conn:
+            rows = await db_manager.fetch_all(conn, "landmark_search", LANDMARK_QUERY, {
+                "vectors": [vector_literal(embedding) for embedding in embeddings],
+                "state_ids": state_ids,
+                "min_score": floor,
+                "after_score": after_score,
+                "after_id": after_id,
+                "page_size": page_size,
+            })
+
+    landmarks = []
+    for preference, *row in rows[:limit]:
+        landmark = convert_row_to_dict(tuple(row))
+        landmark['matched_preference'] = texts[preference - 1]
+        landmarks.append(landmark)
+    next_cursor = encode_cursor(landmarks[-1]['score'], landmarks[-1]['id']) if len(rows) > limit else None
+    return landmarks, next_cursor
+
+@router.post("/recommend", response_model=LandmarksPage)
 async def get_landmarks(request: Request, landmarks_request: LandmarksRequestByText):
     """Search for landmarks based on a user message and preferred activities."""
     start_time = time.time()
     logger.info(f"Received landmarks request for city: {landmarks_request.city_name}")
     
     try:
-        async with db_manager.get_connection() as conn:
-            # Search for Landmarks by user message
-            msg_start_time = time.time()
-            landmarks_by_message = await get_landmark_by_text(conn, landmarks_request.city_name, landmarks_request.user_message)
-            logger.info(f"Message-based search completed in {time.time() - msg_start_time:.2f}s with {len(landmarks_by_message)} results")
-
-            # Search for Landmarks by user activities
-            activities_start_time = time.time()
-            landmarks_by_user_activities = []
-            if landmarks_request.preferred_landmarks:
-                landmarks_by_user_activities = await get_landmark_by_user_activities(
-                    conn, landmarks_request.city_name, landmarks_request.preferred_landmarks
-                )
-                logger.info(f"Activities-based search completed in {time.time() - activities_start_time:.2f}s with {len(landmarks_by_user_activities)} results")
-
-            # Combine and deduplicate results
-            landmark_list = landmarks_by_message + landmarks_by_user_activities
-            landmark_list = list({landmark['id']: landmark for landmark in landmark_list}.values())
-            
-            # Sort by similarity score
-            landmark_list.sort(key=lambda x: x['score'], reverse=True)
-
-            if not landmark_list:
-                logger.warning(f"No landmarks found for city: {landmarks_request.city_name}")
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No landmarks found for city: {landmarks_request.city_name}"
-                )
-
-            total_time = time.time() - start_time
-            logger.info(f"Total request processing time: {total_time:.2f}s")
-            return {"landmarks": landmark_list}
-            
+        # The message and every preferred landmark are searched together
+        search_start_time = time.time()
+        landmark_list, next_cursor = await search_landmarks(
+            landmarks_request.city_name,
+            [landmarks_request.user_message, *landmarks_request.preferred_landmarks],
+            limit=landmarks_request.limit,
+            min_score=landmarks_request.min_score,
+            cursor=landmarks_request.cursor
+        )
+        logger.info(f"Search over {1 + len(landmarks_request.preferred_landmarks)} texts completed in "
+                    f"{time.time() - search_start_time:.2f}s with {len(landmark_list)} results")
+
+        if not landmark_list and not landmarks_request.cursor:
+            logger.warning(f"No landmarks found for city: {landmarks_request.city_name}")
+            raise HTTPException(
+                status_code=404,
+                detail=f"No landmarks found for city: {landmarks_request.city_name}"
+            )
+
+        total_time = time.time() - start_time
+        logger.info(f"Total request processing time: {total_time:.2f}s")
+        return {"landmarks": landmark_list, "next_cursor": next_cursor}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -173,5 +192,3 @@ async def get_landmarks(request: Request, landmarks_request: LandmarksRequestByT
             status_code=500,
             detail="An error occurred while searching for landmarks"
         )
-
-
@@ -1,73 +1,45 @@
 from typing import List, Dict, Any
-import numpy as np
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
 import os
 from datetime import datetime, date
-import aiohttp
 import logging
-from config_helper import get_api_urls
-import asyncio
+from APIs.embedding_system.wire import vector_literal
+from APIs.recommendation_system.db_manager import db_manager
+from APIs.recommendation_system.embedding_client import embedding_client
 
 logger = logging.getLogger(__name__)
 
+# Vector similarity search with state and date filtering. Ranked by exact similarity
+# over the matching trips: an HNSW scan applies these filters after collecting only
+# ef_search candidates and can come back empty while matching trips exist
+TRIP_QUERY = db_manager.register_statement("trip_search", """
+    SELECT 
+        t.*,
+        1 - (t.embedding <=> %s::vector) as similarity_score
+    FROM trips t
+    WHERE t.is_active = true 
+    AND t.available_seats > 0
+    AND (
+        t.state ILIKE %s
+        OR t.state ILIKE %s
+        OR t.state ILIKE %s
+        OR t.state ILIKE %s
+    )
+    AND t.date >= %s AND t.date <= %s
+    ORDER BY similarity_score DESC
+    LIMIT %s
+""")
+
+# Same search when nothing is scheduled in the requested dates
+TRIP_QUERY_ANY_DATE = db_manager.register_statement(
+    "trip_search_any_date", TRIP_QUERY.replace("AND t.date >= %s AND t.date <= %s", "")
+)
+
 class TripRecommender:
-    def __init__(self, db_params: Dict[str, Any]):
-        """
-        Initialize the trip recommender system.
-        
-        Args:
-            db_params (Dict[str, Any]): Database connection parameters
-        """
-        self.db_params = db_params
-        self.embedding_api_url = get_api_urls().get('embedding')
-        if not self.embedding_api_url:
-            raise ValueError("Embedding API URL not found in configuration")
-        
-    async def _get_db_connection(self):
-        """Create a database connection."""
-        try:
-            return psycopg2.connect(**self.db_params)
-        except Exception as e:
-            logger.error(f"Failed to create database connection: {str(e)}")
-            raise
-    
-    async def _get_embedding(self, text: str) -> List[float]:
-        """Get embedding for a text using the embedding API."""
-        try:
-            if not text or not text.strip():
-                logger.warning("Empty text provided for embedding")
-                return None
-                
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.post(
-                        self.embedding_api_url,
-                        json={"text": text},
-                        timeout=10
-                    ) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            if 'embedding' not in result:
-                                logger.error(f"No embedding in response: {result}")
-                                return None
-                            return result['embedding']
-                        else:
-                            logger.error(f"Error getting embedding: {response.status}")
-                            return None
-                except aiohttp.ClientConnectorError as e:
-                    logger.error(f"Could not connect to embedding service: {str(e)}")
-                    return None
-                except asyncio.TimeoutError:
-                    logger.error("Embedding API request timed out")
-                    return None
-                except aiohttp.ClientError as e:
-                    logger.error(f"Error calling embedding API: {str(e)}")
-                    return None
-        except Exception as e:
-            logger.error(f"Unexpected error getting embedding: {str(e)}")
-            return None
-    
+    def __init__(self):
+        """Initialize the trip recommender system on the shared connection pool."""
+        self.db_manager = db_manager
+
     def _extract_conversation_context(self, user_messages: Dict[str, Any]) -> str:
         """Extract relevant context from the entire conversation."""
         if not user_messages:
@@ -248,14 +220,13 @@ class TripRecommender:
                 return []
             
             # Get embedding for context
-            context_embedding = await self._get_embedding(context)
-            if not context_embedding:
+            context_embedding = await embedding_client.embed(context)
+            if context_embedding is None:
                 logger.warning("Failed to get embedding for context")
                 return []
             
             # Query database with vector similarity
-            conn = await self._get_db_connection()
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            async with self.db_manager.get_connection(readonly=True) as conn:
                 # Prepare patterns for state matching
                 state = user_preferences.get('state', '').strip()
                 exact_pattern = state
@@ -274,55 +245,28 @@ class TripRecommender:
                     except Exception as e:
                         logger.error(f"Error parsing arrival date: {str(e)}")
                 
-                # Build the query with vector similarity and date filtering
-                query = """
-                    WITH ranked_trips AS (
-                        SELECT 
-                            t.*,
-                            1 - (t.embedding <=> %s::vector) as similarity_score
-                        FROM trips t
-                        WHERE t.is_active = true 
-                        AND t.available_seats > 0
-                        AND (
-                            t.state ILIKE %s
-                            OR t.state ILIKE %s
-                            OR t.state ILIKE %s
-                            OR t.state ILIKE %s
-                        )
-                        AND t.date >= %s AND t.date <= %s
-                    )
-                    SELECT * FROM ranked_trips
-                    ORDER BY similarity_score DESC
-                    LIMIT %s
-                """
-                
                 # Get top 10 trips initially for better selection
                 initial_limit = 10
                 
-                params = [
-                    context_embedding,
-                    exact_pattern,
-                    start_pattern,
-                    middle_pattern,
-                    end_pattern,
+                query_vector = vector_literal(context_embedding)
+                state_patterns = [exact_pattern, start_pattern, middle_pattern, end_pattern]
+                date_range = [
                     start_date.strftime('%Y-%m-%d') if start_date else '1970-01-01',
-                    end_date.strftime('%Y-%m-%d') if end_date else '2100-12-31',
-                    initial_limit
+                    end_date.strftime('%Y-%m-%d') if end_date else '2100-12-31'
                 ]
+                params = [query_vector, *state_patterns, *date_range, initial_limit]
                 
-                cur.execute(query, tuple(params))
-                
-                trips = cur.fetchall()
+                trips = await self.db_manager.fetch_all(conn, "trip_search", TRIP_QUERY, tuple(params), row_factory=dict_row)
                 logger.info(f"Found {len(trips)} trips in database")
                 
                 if not trips and start_date:
-                    # If no trips found on exact date, try without date filter
+                    # The ranking is exact, so an empty result means no trip matches these dates;
+                    # only then widen the search to any date
                     logger.info("No trips found on exact date, trying without date filter")
-                    query = query.replace("AND t.date >= %s AND t.date <= %s", "")
-                    params.pop(-3)  # Remove end_date parameter
-                    params.pop(-3)  # Remove start_date parameter
-                    cur.execute(query, tuple(params))
-                    trips = cur.fetchall()
+                    params = [query_vector, *state_patterns, initial_limit]
+                    trips = await self.db_manager.fetch_all(
+                        conn, "trip_search_any_date", TRIP_QUERY_ANY_DATE, tuple(params), row_factory=dict_row
+                    )
                     logger.info(f"Found {len(trips)} trips without date filter")
                 
                 if not trips:
@@ -1,16 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from config_helper import get_db_params
+from typing import List, Dict, Any
 from APIs.recommendation_system.trip_recommender import TripRecommender
+from APIs.recommendation_system.db_manager import db_manager
 import logging
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(db_manager.query_scope("trips"))])
 logger = logging.getLogger(__name__)
 
 # Initialize recommender with connection pool
 try:
-    recommender = TripRecommender(get_db_params())
+    recommender = TripRecommender()
 except Exception as e:
     logger.error(f"Failed to initialize TripRecommender: {str(e)}")
     raise
@@ -58,6 +58,9 @@ async def get_recommendations(request: TripRequest):
                 request.user_messages, 
                 top_n=3  # Default to 3 recommendations
             )
+        except HTTPException:
+            # 503/504 from the database layer keep their status
+            raise
         except Exception as e:
             logger.error(f"Error in recommender.get_recommendations: {str(e)}", exc_info=True)
             raise HTTPException(
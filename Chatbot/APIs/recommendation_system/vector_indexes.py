@@ -0,0 +1,270 @@
+"""
+Approximate nearest neighbour indexes on the catalog embedding columns.
+
+Usage (from the Chatbot directory):
+    python -m APIs.recommendation_system.vector_indexes create
+    python -m APIs.recommendation_system.vector_indexes status
+    python -m APIs.recommendation_system.vector_indexes report --top-k 10 --ef-search 20,40,80,160
+    python -m APIs.recommendation_system.vector_indexes drop
+
+``create`` builds an HNSW (or IVFFlat) cosine index on ``embedding`` for every table in
+``EMBEDDING_TABLES`` that does not have one on that column yet, and btree indexes on the
+``state_id`` columns the routers filter on, with ``CREATE INDEX CONCURRENTLY`` so the API
+keeps serving while they build. Index names carry the column's dimension, because
+``reduction migrate`` renames ``embedding`` to ``embedding_full`` and the existing index
+moves with it. pgvector only uses these indexes for ``ORDER BY embedding <=> %s::vector
+LIMIT n``; the API applies ``hnsw.ef_search`` / ``ivfflat.probes`` per endpoint from
+``vector_index.search``. ``report`` measures recall@k and latency of index scans against
+exact search for a range of those settings, with and without the city filter the
+routers apply, to choose them per table as the catalog grows.
+
+Index builds set ``maintenance_work_mem`` for their session and ``CREATE INDEX
+CONCURRENTLY`` cannot run inside a transaction, so these commands connect directly to
+the database rather than through a transaction-mode pooler; see ``get_db_direct_params``.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import logging
+import time
+import numpy as np
+from APIs.embedding_system.reduction import EMBEDDING_TABLES, _top_k
+from APIs.embedding_system.wire import vector_literal
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("hnsw", "ivfflat")
+
+# Tables the routers filter with ``state_id = ANY(%s)``; a btree on state_id lets Postgres
+# pre-filter them before ordering by distance
+STATE_ID_TABLES = ("activities", "landmarks", "hotels")
+
+# Column each router filters on before ranking, used by the filtered report
+FILTER_COLUMNS = {
+    "activities": "state_id",
+    "landmarks": "state_id",
+    "trips": "state",
+}
+
+
+def index_name(table: str, method: str, dim: int) -> str:
+    return f"{table}_embedding_{dim}d_{method}_idx" if dim > 0 else f"{table}_embedding_{method}_idx"
+
+
+def _dimension(cur, table: str) -> int:
+    """Declared dimension of ``table.embedding`` (pgvector stores it as the type modifier)."""
+    cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embedding'", (table,))
+    row = cur.fetchone()
+    return row[0] if row else -1
+
+
+def vector_indexes(cur, table: str) -> List[Tuple[str, str, str]]:
+    """(index, column, method) for every pgvector index on ``table``."""
+    cur.execute(
+        """
+        SELECT c.relname, a.attname, am.amname
+        FROM pg_index x
+        JOIN pg_class c ON c.oid = x.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey)
+        WHERE x.indrelid = %s::regclass AND am.amname = ANY(%s)
+        ORDER BY c.relname
+        """,
+        (table, list(METHODS))
+    )
+    return cur.fetchall()
+
+
+def _row_count(cur, table: str) -> int:
+    cur.execute(f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def index_options(method: str, config: Dict[str, Any], rows: int) -> str:
+    """WITH (...) clause for the index build."""
+    if method == "hnsw":
+        hnsw_config = config.get('hnsw', {})
+        return f"m = {int(hnsw_config.get('m', 16))}, ef_construction = {int(hnsw_config.get('ef_construction', 64))}"
+    lists = config.get('ivfflat', {}).get('lists')
+    if not lists:
+        # pgvector's guidance: rows / 1000 up to a million rows, sqrt(rows) beyond
+        lists = rows // 1000 if rows <= 1_000_000 else int(np.sqrt(rows))
+    return f"lists = {max(int(lists), 10)}"
+
+
+def create_command(conn, config: Dict[str, Any], method: str):
+    if method not in METHODS:
+        raise ValueError(f"Unknown index method {method}, expected one of {METHODS}")
+    with conn.cursor() as cur:
+        if config.get('maintenance_work_mem'):
+            cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (config['maintenance_work_mem'],))
+        for table in EMBEDDING_TABLES:
+            existing = [name for name, column, am in vector_indexes(cur, table) if column == "embedding" and am == method]
+            if existing:
+                print(f"{table}: embedding already has a {method} index ({existing[0]})")
+                continue
+            rows = _row_count(cur, table)
+            options = index_options(method, config, rows)
+            started = time.perf_counter()
+            cur.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, method, _dimension(cur, table))} "
+                f"ON {table} USING {method} (embedding vector_cosine_ops) WITH ({options})"
+            )
+            cur.execute(f"ANALYZE {table}")
+            print(f"{table}: {method} index ({options}) on {rows} rows in {time.perf_counter() - started:.1f}s")
+        for table in STATE_ID_TABLES:
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_state_id_idx ON {table} (state_id)")
+            print(f"{table}: state_id index")
+
+
+def drop_command(conn):
+    """Drop the vector indexes on ``embedding``; any on ``embedding_full`` are kept for a rollback."""
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            for name, column, _ in vector_indexes(cur, table):
+                if column == "embedding":
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            print(f"{table}: vector indexes dropped")
+
+
+def status_command(conn):
+    print(f"{'table':<12} {'index':<36} {'column':<16} {'size':>10} {'scans':>8}")
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            cur.execute(
+                """
+                SELECT i.indexrelname, a.attname, pg_size_pretty(pg_relation_size(i.indexrelid)), i.idx_scan
+                FROM pg_stat_user_indexes i
+                JOIN pg_index x ON x.indexrelid = i.indexrelid
+                JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey)
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE i.relname = %s AND am.amname = ANY(%s)
+                """,
+                (table, list(METHODS))
+            )
+            indexes = cur.fetchall()
+            if not any(column == "embedding" for _, column, _, _ in indexes):
+                # What the routers query; an index left on embedding_full does not help them
+                print(f"{table:<12} {'(none on embedding, exact scans)':<36}")
+            for name, column, size, scans in indexes:
+                print(f"{table:<12} {name:<36} {column:<16} {size:>10} {scans:>8}")
+
+
+def _fetch_rows(cur, table: str) -> Tuple[List[Any], List[Any], np.ndarray]:
+    key = EMBEDDING_TABLES[table]
+    filter_column = FILTER_COLUMNS.get(table, "NULL")
+    cur.execute(f"SELECT {key}, {filter_column}, embedding::real[] FROM {table} WHERE embedding IS NOT NULL ORDER BY {key}")
+    rows = cur.fetchall()
+    if not rows:
+        return [], [], np.zeros((0, 0), dtype=np.float32)
+    return [row[0] for row in rows], [row[1] for row in rows], np.asarray([row[2] for row in rows], dtype=np.float32)
+
+
+def _search(cur, table: str, setting: Optional[Tuple[str, int]], query: np.ndarray, top_k: int,
+            filter_value: Any = None) -> Tuple[List[Any], float]:
+    """Run one index-ordered search in its own transaction and return (ids, milliseconds)."""
+    key = EMBEDDING_TABLES[table]
+    if filter_value is None:
+        sql, params = f"SELECT {key} FROM {table} ORDER BY embedding <=> %s::vector LIMIT %s", (vector_literal(query), top_k)
+    else:
+        sql = f"SELECT {key} FROM {table} WHERE {FILTER_COLUMNS[table]} = %s ORDER BY embedding <=> %s::vector LIMIT %s"
+        params = (filter_value, vector_literal(query), top_k)
+    with cur.connection.transaction():
+        if setting is None:
+            cur.execute("SET LOCAL enable_indexscan = off")
+        else:
+            cur.execute("SELECT set_config(%s, %s, true)", (setting[0], str(setting[1])))
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        ids = [row[0] for row in cur.fetchall()]
+        return ids, (time.perf_counter() - started) * 1000
+
+
+def _uses_index(cur, table: str, setting: Tuple[str, int], query: np.ndarray, top_k: int) -> bool:
+    with cur.connection.transaction():
+        cur.execute("SELECT set_config(%s, %s, true)", (setting[0], str(setting[1])))
+        cur.execute(f"EXPLAIN SELECT 1 FROM {table} ORDER BY embedding <=> %s::vector LIMIT %s",
+                    (vector_literal(query), top_k))
+        plan = "\n".join(row[0] for row in cur.fetchall())
+    return any(name in plan for name, column, _ in vector_indexes(cur, table) if column == "embedding")
+
+
+def report_command(conn, method: str, values: List[int], top_k: int, num_queries: int, filtered: bool):
+    """Recall@k and latency of index scans against exact cosine search, per table and setting."""
+    parameter = "hnsw.ef_search" if method == "hnsw" else "ivfflat.probes"
+    rng = np.random.default_rng(0)
+    print(f"{'table':<12} {'filter':<7} {parameter:<16} {'recall@' + str(top_k):>10} {'mean ms':>8} {'p95 ms':>8} {'index':>6}")
+    with conn.cursor() as cur:
+        for table in EMBEDDING_TABLES:
+            ids, filter_values, matrix = _fetch_rows(cur, table)
+            if len(ids) <= top_k:
+                print(f"{table:<12} {'':<7} {'':<16} {'n/a':>10}   only {len(ids)} rows")
+                continue
+            sample = rng.choice(len(ids), size=min(num_queries, len(ids)), replace=False)
+            # Perturb the queries so a row is not trivially its own nearest neighbour
+            noise = rng.normal(scale=0.05 * float(np.abs(matrix).mean()), size=(len(sample), matrix.shape[1]))
+            queries = matrix[sample] + noise.astype(np.float32)
+
+            modes = [("none", [None] * len(sample))]
+            if filtered and table in FILTER_COLUMNS:
+                modes.append(("city", [filter_values[i] for i in sample]))
+            for mode, query_filters in modes:
+                # Exact neighbours computed in NumPy over the same (filtered) rows the query sees
+                truth = []
+                for query, filter_value in zip(queries, query_filters):
+                    candidates = np.arange(len(ids)) if filter_value is None else np.flatnonzero(
+                        np.array([value == filter_value for value in filter_values]))
+                    order = _top_k(query[None, :], matrix[candidates], top_k)[0]
+                    truth.append({ids[candidates[i]] for i in order})
+
+                for setting in [None] + [(parameter, value) for value in values]:
+                    recalls, timings = [], []
+                    for query, filter_value, expected in zip(queries, query_filters, truth):
+                        found, elapsed_ms = _search(cur, table, setting, query, top_k, filter_value)
+                        recalls.append(len(expected & set(found)) / max(len(expected), 1))
+                        timings.append(elapsed_ms)
+                    label = "exact" if setting is None else str(setting[1])
+                    used = "-" if setting is None else ("yes" if _uses_index(cur, table, setting, queries[0], top_k) else "no")
+                    print(f"{table:<12} {mode:<7} {label:<16} {np.mean(recalls):>10.3f} {np.mean(timings):>8.2f} "
+                          f"{np.percentile(timings, 95):>8.2f} {used:>6}")
+
+
+def main():
+    import psycopg
+    from config_helper import get_db_direct_params, get_vector_index_config
+
+    parser = argparse.ArgumentParser(description="Create, inspect and evaluate vector indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="Build the configured index on every embedding column")
+    create_parser.add_argument("--method", choices=METHODS, default=None)
+    subparsers.add_parser("drop", help="Drop the vector indexes, falling back to exact scans")
+    subparsers.add_parser("status", help="List vector indexes with their size and scan counts")
+    report_parser = subparsers.add_parser("report", help="Recall@k and latency per search setting")
+    report_parser.add_argument("--method", choices=METHODS, default=None)
+    report_parser.add_argument("--ef-search", default="10,20,40,80,160,320",
+                               help="Comma-separated hnsw.ef_search (or ivfflat.probes) values to try")
+    report_parser.add_argument("--top-k", type=int, default=10)
+    report_parser.add_argument("--queries", type=int, default=100)
+    report_parser.add_argument("--no-filter", action="store_true", help="Skip the per-city filtered measurements")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = get_vector_index_config()
+    method = getattr(args, "method", None) or config.get('method', "hnsw")
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block, and the session
+    # settings the build uses must not land on a pooled server connection
+    with psycopg.connect(**get_db_direct_params(), autocommit=True) as conn:
+        if args.command == "create":
+            create_command(conn, config, method)
+        elif args.command == "drop":
+            drop_command(conn)
+        elif args.command == "status":
+            status_command(conn)
+        else:
+            values = [int(value) for value in args.ef_search.split(",") if value.strip()]
+            report_command(conn, method, values, args.top_k, args.queries, not args.no_filter)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 import requests
-from config_helper import get_db_params, get_api_urls
+from config_helper import get_api_urls
+from db_pool import get_db_connection
+from APIs.embedding_system.wire import FLOAT32_MEDIA_TYPE, decode_embedding_response, vector_literal
 from fastapi import FastAPI, HTTPException
-import psycopg2
 
 app = FastAPI()
 
 EMBEDDING_API_URL = get_api_urls().get('embedding')
-DB_Prams = get_db_params()
 
 def get_user_msgs_embedding(conversation_id, conn=None):
     with conn.cursor() as cur:
@@ -15,7 +15,8 @@ def get_user_msgs_embedding(conversation_id, conn=None):
         if not user_data:
             return {"error": "No conversation found with this conversation id"}
         user_msgs, user_values = concatenate_user_messages(user_data[0]), user_data[1]
-        user_msgs_embedding = requests.post(EMBEDDING_API_URL, json={"text": user_msgs}).json()
+        response = requests.post(EMBEDDING_API_URL, json={"text": user_msgs}, headers={"Accept": FLOAT32_MEDIA_TYPE})
+        user_msgs_embedding = decode_embedding_response(response.content, response.headers)[0]
         return user_msgs_embedding, user_values
 
 
@@ -30,54 +31,42 @@ def concatenate_user_messages(user_msgs_json):
 
 @app.get("/suggest_trips")
 def suggest_trips(conversation_id: int, city_name: str):
-    conn = None
-    cur = None
-
     try:
-        conn = psycopg2.connect(**DB_Prams)
-        cur = conn.cursor()
-        user_msgs_embedding, user_values = get_user_msgs_embedding(conversation_id, conn)
-
-        if "error" in user_msgs_embedding:
-            raise HTTPException(status_code=404, detail=user_msgs_embedding["error"])
-
-        budget = user_values["budget"]
-        start_date = user_values["arrival_date"][0]
-        end_date = user_values["arrival_date"][1]
-        duration = user_values.get("duration", "0").strip()
-        # get the best 3 matched trips from the database considering the city name and trip date
-        select_query = ('''SELECT *,1 - (embedding <=> %s::vector) AS similarity
-                            FROM trips
-                            JOIN LATERAL (
-                                SELECT
-                                    CASE
-                                        WHEN trips.duration ~ '^\d+ Hours' THEN (regexp_replace(trips.duration, '\D+', '', 'g'))::INT
-                                        WHEN trips.duration ~ '^\d+ Days' THEN (regexp_replace(trips.duration, '(\D+).*', '', 'g'))::INT*24
-                                        ELSE NULL
-                                    END AS duration_hours
-                            ) AS extracted_duration ON TRUE
-                            WHERE lower(state) like %s
-                            AND price <= %s
-                            AND date BETWEEN %s AND %s and date is not null
-                            AND is_active = true
-                            AND duration_hours <= %s
-                            ORDER BY similarity DESC
-                            LIMIT 3;
-                            ''')
-        select_prams = (user_msgs_embedding["embedding"],'%'+city_name.lower()+'%', int(budget), start_date, end_date, duration)
-
-        cur.execute(select_query, select_prams)
-        trips = cur.fetchall()
-
-        return {"trips": trips}
+        with get_db_connection() as conn, conn.cursor() as cur:
+            user_data = get_user_msgs_embedding(conversation_id, conn)
+
+            if isinstance(user_data, dict) and "error" in user_data:
+                raise HTTPException(status_code=404, detail=user_data["error"])
+            user_msgs_embedding, user_values = user_data
+
+            budget = user_values["budget"]
+            start_date = user_values["arrival_date"][0]
+            end_date = user_values["arrival_date"][1]
+            duration = user_values.get("duration", "0").strip()
+            # get the best 3 matched trips from the database considering the city name and trip date
+            select_query = ('''SELECT *,1 - (embedding <=> %s::vector) AS similarity
+                                FROM trips
+                                JOIN LATERAL (
+                                    SELECT
+                                        CASE
+                                            WHEN trips.duration ~ '^\d+ Hours' THEN (regexp_replace(trips.duration, '\D+', '', 'g'))::INT
+                                            WHEN trips.duration ~ '^\d+ Days' THEN (regexp_replace(trips.duration, '(\D+).*', '', 'g'))::INT*24
+                                            ELSE NULL
+                                        END AS duration_hours
+                                ) AS extracted_duration ON TRUE
+                                WHERE lower(state) like %s
+                                AND price <= %s
+                                AND date BETWEEN %s AND %s and date is not null
+                                AND is_active = true
+                                AND duration_hours <= %s
+                                ORDER BY similarity DESC
+                                LIMIT 3;
+                                ''')
+            select_prams = (vector_literal(user_msgs_embedding),'%'+city_name.lower()+'%', int(budget), start_date, end_date, duration)
+
+            cur.execute(select_query, select_prams)
+            trips = cur.fetchall()
+
+            return {"trips": trips}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
-
-
-
@@ -5,9 +5,8 @@ from rasa_sdk.events import SlotSet, ActiveLoop
 from typing import Any, Text, Dict, List
 from datetime import datetime
 import logging
-from contextlib import contextmanager
-from config_helper import get_db_params, get_api_urls
-import psycopg2
+from config_helper import get_api_urls
+from db_pool import get_db_connection
 import sys
 import os
 import re
@@ -25,23 +24,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-DB_Prams = get_db_params()
-
-
-@contextmanager
-def get_db_connection():
-    conn = None
-    try:
-        conn = psycopg2.connect(**DB_Prams)
-        yield conn
-    except psycopg2.Error as e:
-        logger.error(f"Database error: {str(e)}")
-        raise
-    finally:
-        if conn:
-            conn.close()
-
-
 def fetch_cities_from_database():
     # Fetch cities from a database
     try:
@@ -0,0 +1,71 @@
+"""
+Measure embedding throughput against the number of model worker processes.
+
+Usage (from the Chatbot directory):
+    python -m benchmarks.embedding_workers --workers 1 2 4 8 --requests 400 --batch-size 8
+
+Each run starts a fresh EmbeddingWorkerPool, warms every worker up, then fires
+``--requests`` encode jobs of ``--batch-size`` texts from ``--clients`` threads and
+reports requests per second and the scaling relative to a single worker.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import time
+from config_helper import get_embedding_config
+from APIs.embedding_system.worker_pool import EmbeddingWorkerPool, available_cores
+
+SAMPLE_TEXTS = [
+    "I want to go diving and snorkeling in the red sea",
+    "Show me the pyramids of Giza and the Egyptian museum",
+    "A relaxing nile cruise between Luxor and Aswan",
+    "Desert safari in the white desert with camping under the stars",
+    "Family friendly beach resort with a kids club",
+    "Historical mosques and the old markets of islamic cairo",
+    "Hiking mount sinai at sunrise and visiting saint catherine",
+    "Luxury spa weekend in el gouna with golf",
+]
+
+
+def run(num_workers: int, num_requests: int, batch_size: int, clients: int, model_name: str, backend_config: dict) -> float:
+    pool = EmbeddingWorkerPool(model_name, backend_config, num_workers).start()
+    try:
+        batch = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(batch_size)]
+        for _ in range(num_workers * 2):
+            pool.encode(batch)
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(lambda _: pool.encode(batch), range(num_requests)))
+        return num_requests / (time.perf_counter() - start_time)
+    finally:
+        pool.stop()
+
+
+def main():
+    cores = len(available_cores())
+    parser = argparse.ArgumentParser(description="Embedding throughput vs worker count")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[n for n in (1, 2, 4, 8, 16) if n <= cores] or [1])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--batch-size", type=int, default=8, help="Texts per request")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent client threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    embedding_config = get_embedding_config()
+    model_name = embedding_config.get('model', "Camellia-Mohamed/fine-tuned-sbert-for-tourism")
+    backend_config = embedding_config.get('backend', {})
+
+    print(f"{cores} cores available, backend={backend_config.get('type', 'torch')}, "
+          f"{args.requests} requests x {args.batch_size} texts, {args.clients} clients")
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8}")
+    baseline = None
+    for num_workers in args.workers:
+        rps = run(num_workers, args.requests, args.batch_size, args.clients, model_name, backend_config)
+        baseline = baseline or rps
+        print(f"{num_workers:>8} {rps:>10.1f} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
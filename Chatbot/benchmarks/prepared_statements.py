@@ -0,0 +1,129 @@
+"""
+Compare the hot recommendation queries with and without server-side prepared statements.
+
+Usage (from the Chatbot directory, against a local Postgres with pgvector):
+    python -m benchmarks.prepared_statements --dsn postgresql://postgres@localhost/postgres --iterations 500
+
+The benchmark builds a scratch ``bench_prepared`` schema with synthetic states,
+activities and landmarks, runs the real ACTIVITY_QUERY and LANDMARK_QUERY
+``--iterations`` times each way on one connection, and reports latency percentiles
+together with the planning time the unprepared path pays on every call.
+"""
+import argparse
+import json
+import logging
+import time
+import numpy as np
+import psycopg
+from APIs.embedding_system.wire import vector_literal
+from APIs.recommendation_system.activities_api import ACTIVITY_QUERY
+from APIs.recommendation_system.landmarks_api import LANDMARK_QUERY
+
+SCHEMA = "bench_prepared"
+CITIES = ["Cairo", "Giza", "Luxor", "Aswan", "Alexandria", "Hurghada", "Sharm El Sheikh", "Dahab"]
+
+
+def create_schema(conn, rows: int, dim: int):
+    rng = np.random.default_rng(0)
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}, public")
+        cur.execute("CREATE TABLE states (state_id serial PRIMARY KEY, name text)")
+        cur.execute(f"""
+            CREATE TABLE activities (
+                activity_id serial PRIMARY KEY, name text, description text, embedding vector({dim}),
+                price numeric, duration_in_hours float, img text, category text, state_id int REFERENCES states
+            )
+        """)
+        cur.execute(f"""
+            CREATE TABLE landmarks (
+                landmark_id serial PRIMARY KEY, name text, state_id int REFERENCES states, longitude float,
+                latitude float, description text, embedding vector({dim}), price float, img text
+            )
+        """)
+        cur.executemany("INSERT INTO states (name) VALUES (%s)", [(city,) for city in CITIES])
+        cur.executemany(
+            "INSERT INTO activities (name, description, embedding, price, duration_in_hours, img, category, state_id) "
+            "VALUES (%s, %s, %s::vector, %s, %s, %s, %s, %s)",
+            [(f"activity {i}", "synthetic activity", vector_literal(rng.normal(size=dim)), 100, 2.0, "", "tour",
+              i % len(CITIES) + 1) for i in range(rows)]
+        )
+        cur.executemany(
+            "INSERT INTO landmarks (name, state_id, longitude, latitude, description, embedding, price, img) "
+            "VALUES (%s, %s, %s, %s, %s, %s::vector, %s, %s)",
+            [(f"landmark {i}", i % len(CITIES) + 1, 31.2, 30.0, "synthetic landmark",
+              vector_literal(rng.normal(size=dim)), 50.0, "") for i in range(rows)]
+        )
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def planning_time_ms(conn, query: str, params) -> float:
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params, prepare=False)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Planning Time"]
+
+
+def run(conn, query: str, params_list, prepare: bool) -> np.ndarray:
+    timings = []
+    with conn.cursor() as cur:
+        for params in params_list:
+            start_time = time.perf_counter()
+            cur.execute(query, params, prepare=prepare)
+            cur.fetchall()
+            timings.append((time.perf_counter() - start_time) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepared vs unprepared recommendation queries")
+    parser.add_argument("--dsn", default="postgresql://postgres@localhost/postgres")
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic activities and landmarks")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = np.random.default_rng(1)
+    with psycopg.connect(args.dsn) as conn:
+        # Only the explicit prepare=True runs may use prepared statements
+        conn.prepare_threshold = None
+        create_schema(conn, args.rows, args.dim)
+        try:
+            print(f"{args.rows} rows, dim={args.dim}, {args.iterations} iterations per mode")
+            print(f"{'query':<16} {'mode':<11} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'plan ms':>8}")
+            for name, query in (("activity_search", ACTIVITY_QUERY), ("landmark_search", LANDMARK_QUERY)):
+                # Three preference vectors per request, one city, as the routers send them
+                params_list = [
+                    ([vector_literal(rng.normal(size=args.dim)) for _ in range(3)], [i % len(CITIES) + 1])
+                    for i in range(args.iterations)
+                ]
+                if name == "landmark_search":
+                    # First page of 50 with no similarity floor
+                    params_list = [
+                        {"vectors": vectors, "state_ids": state_ids, "min_score": -1.0,
+                         "after_score": float("inf"), "after_id": 0, "page_size": 51}
+                        for vectors, state_ids in params_list
+                    ]
+                plan_ms = planning_time_ms(conn, query, params_list[0])
+                # Warm the buffer cache before timing either mode
+                run(conn, query, params_list[:20], prepare=False)
+                for mode, prepare in (("unprepared", False), ("prepared", True)):
+                    timings = run(conn, query, params_list, prepare)
+                    print(f"{name:<16} {mode:<11} {timings.mean():>8.2f} {np.percentile(timings, 50):>8.2f} "
+                          f"{np.percentile(timings, 95):>8.2f} {plan_ms if not prepare else 0.0:>8.2f}")
+        finally:
+            if not args.keep:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+                conn.commit()
+
+
+if __name__ == "__main__":
+    main()
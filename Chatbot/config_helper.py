@@ -22,4 +22,53 @@ def get_db_params():
 # Get API URLs
 def get_api_urls():
     config = load_config()
-    return config.get('apis', {})
\ No newline at end of file
+    return config.get('apis', {})
+
+
+# Get embedding service settings
+def get_embedding_config():
+    config = load_config()
+    return config.get('embedding', {})
+
+
+# Get connection pool settings shared by the action server and the API service
+def get_db_pool_config():
+    config = load_config()
+    return config.get('database_pool', {})
+
+
+# Get vector index build and search settings
+def get_vector_index_config():
+    config = load_config()
+    return config.get('vector_index', {})
+
+
+# Get city name resolution settings for the recommendation API
+def get_city_resolver_config():
+    config = load_config()
+    return config.get('city_resolver', {})
+
+
+# Get settings for the in-memory per-city catalog indexes
+def get_catalog_index_config():
+    config = load_config()
+    return config.get('catalog_index', {})
+
+
+# Get connection parameters for each read replica, each entry overriding the primary's settings
+def get_db_replica_params():
+    config = load_config()
+    primary = config.get('database', {})
+    return [{**primary, **replica} for replica in config.get('database_replicas') or []]
+
+
+# Get connection parameters that bypass a transaction-mode pooler, for maintenance that needs a session
+def get_db_direct_params():
+    config = load_config()
+    params = dict(config.get('database', {}))
+    if config.get('database_direct_host'):
+        params['host'] = config['database_direct_host']
+    elif '-pooler.' in str(params.get('host', '')):
+        # Neon's pooled endpoint; the direct endpoint is the same host without "-pooler"
+        params['host'] = params['host'].replace('-pooler.', '.', 1)
+    return params
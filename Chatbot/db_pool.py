@@ -0,0 +1,246 @@
+"""
+Shared PostgreSQL connection pooling for the Rasa action server and the API service.
+
+Synchronous callers (actions, Store_User_Messages, suggest_trips) borrow connections
+with ``with get_db_connection() as conn``; the async recommendation API builds its
+pool from the same settings in ``APIs/recommendation_system/db_manager.py``. Both use
+``LeakDetector`` to log connections held longer than ``leak_threshold_seconds`` and
+``IdleValidator`` so only connections that sat idle for a while are probed on checkout.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from config_helper import get_db_params, get_db_pool_config
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_leak_detector = None
+_idle_validator = None
+_health_check_stop = threading.Event()
+
+# Frames from these files are skipped when recording who checked a connection out
+_INTERNAL_FILES = (os.path.abspath(__file__), "contextlib.py", "db_manager.py")
+
+
+def connection_kwargs(params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Connection parameters shared by every pool, with TCP keepalives for long-lived connections."""
+    params = dict(params) if params is not None else get_db_params()
+    params.update({
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 5
+    })
+    return params
+
+
+def _caller() -> str:
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.endswith(_INTERNAL_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+class LeakDetector:
+    """
+    Track borrowed connections and log any held past the threshold.
+
+    Outstanding checkouts are scanned on every new checkout, so a connection that is
+    never returned is reported as soon as anything else needs the pool.
+    """
+
+    def __init__(self, threshold_seconds: float, name: str = "db"):
+        self.threshold = threshold_seconds
+        self.name = name
+        self._checked_out: Dict[int, Tuple[float, str]] = {}
+        self._reported = set()
+        self._lock = threading.Lock()
+        self.leaks_reported = 0
+
+    def checked_out(self, conn, owner: Optional[str] = None):
+        self.check()
+        with self._lock:
+            self._checked_out[id(conn)] = (time.monotonic(), owner or _caller())
+
+    def returned(self, conn):
+        with self._lock:
+            entry = self._checked_out.pop(id(conn), None)
+            self._reported.discard(id(conn))
+        if entry is not None:
+            held = time.monotonic() - entry[0]
+            if self.threshold and held > self.threshold:
+                logger.warning(f"[{self.name}] connection held for {held:.1f}s by {entry[1]}")
+
+    def check(self) -> List[Tuple[str, float]]:
+        """Log and return (owner, seconds held) for every checkout past the threshold."""
+        if not self.threshold:
+            return []
+        now = time.monotonic()
+        leaks = []
+        with self._lock:
+            for key, (started, owner) in self._checked_out.items():
+                held = now - started
+                if held > self.threshold:
+                    leaks.append((owner, held))
+                    if key not in self._reported:
+                        self._reported.add(key)
+                        self.leaks_reported += 1
+                        logger.warning(f"[{self.name}] possible connection leak: held for {held:.1f}s by {owner}")
+        return leaks
+
+    @property
+    def in_use(self) -> int:
+        return len(self._checked_out)
+
+
+class IdleValidator:
+    """
+    Decide on checkout whether a pooled connection needs a liveness probe.
+
+    A connection that was returned (or verified by the background health check) less
+    than ``idle_seconds`` ago is handed out without a round trip; only connections that
+    have been idle longer, and so may have been dropped by the server or a proxy, pay
+    for a probe.
+    """
+
+    def __init__(self, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self._last_used = weakref.WeakKeyDictionary()
+        self._last_health_check = 0.0
+        self.probes = 0
+        self.skipped = 0
+
+    def mark_used(self, conn):
+        self._last_used[conn] = time.monotonic()
+
+    def mark_health_checked(self, started: float):
+        """Every connection idle in the pool at ``started`` has been verified by pool.check()."""
+        self._last_health_check = started
+
+    def needs_probe(self, conn) -> bool:
+        last_seen = max(self._last_used.get(conn, 0.0), self._last_health_check)
+        if time.monotonic() - last_seen > self.idle_seconds:
+            self.probes += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def check(self, conn):
+        """``check`` callback for a sync ConnectionPool."""
+        if self.needs_probe(conn):
+            from psycopg_pool import ConnectionPool
+
+            ConnectionPool.check_connection(conn)
+
+    async def check_async(self, conn):
+        """``check`` callback for an AsyncConnectionPool."""
+        if self.needs_probe(conn):
+            from psycopg_pool import AsyncConnectionPool
+
+            await AsyncConnectionPool.check_connection(conn)
+
+    async def configure_async(self, conn):
+        self.mark_used(conn)
+
+    def stats(self):
+        return {"probes": self.probes, "skipped_probes": self.skipped}
+
+
+def pool_options(pool_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Size and recycling options shared by the sync and async pools."""
+    return {
+        'min_size': pool_config.get('min_size', 1),
+        'max_size': pool_config.get('max_size', 10),
+        'timeout': pool_config.get('timeout_seconds', 30),
+        'max_idle': pool_config.get('max_idle_seconds', 300),
+        'max_lifetime': pool_config.get('max_lifetime_seconds', 1800),
+    }
+
+
+def _health_check_loop(pool, interval: float):
+    while not _health_check_stop.wait(interval):
+        try:
+            started = time.monotonic()
+            pool.check()
+            _idle_validator.mark_health_checked(started)
+        except Exception as e:
+            logger.error(f"Connection pool health check failed: {str(e)}")
+
+
+def get_pool():
+    """Create the process-wide synchronous pool on first use."""
+    global _pool, _leak_detector, _idle_validator
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg_pool import ConnectionPool
+
+                pool_config = get_db_pool_config()
+                _leak_detector = LeakDetector(pool_config.get('leak_threshold_seconds', 30), name="sync-pool")
+                _idle_validator = IdleValidator(pool_config.get('validate_after_idle_seconds', 30))
+                _pool = ConnectionPool(
+                    kwargs=connection_kwargs(),
+                    check=_idle_validator.check,
+                    configure=_idle_validator.mark_used,
+                    open=True,
+                    **pool_options(pool_config)
+                )
+                interval = pool_config.get('health_check_interval_seconds', 60)
+                if interval:
+                    _health_check_stop.clear()
+                    threading.Thread(
+                        target=_health_check_loop, args=(_pool, interval), name="db-pool-health", daemon=True
+                    ).start()
+                atexit.register(close_pool)
+                logger.info("Database connection pool initialized successfully")
+    return _pool
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Borrow a pooled connection; anything left uncommitted is rolled back on return.
+
+    A connection that fails with an OperationalError is closed so the pool discards
+    and replaces just that one.
+    """
+    import psycopg
+    from psycopg import pq
+
+    pool = get_pool()
+    conn = pool.getconn()
+    _leak_detector.checked_out(conn)
+    try:
+        yield conn
+    except psycopg.OperationalError:
+        conn.close()
+        raise
+    finally:
+        _leak_detector.returned(conn)
+        try:
+            if not conn.closed and conn.info.transaction_status != pq.TransactionStatus.IDLE:
+                conn.rollback()
+        except Exception as e:
+            logger.error(f"Error rolling back connection: {str(e)}")
+        if not conn.closed:
+            _idle_validator.mark_used(conn)
+        pool.putconn(conn)
+
+
+def close_pool():
+    global _pool
+    _health_check_stop.set()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None